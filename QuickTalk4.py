@@ -105,33 +105,90 @@ bl_info = {
     "tracker_url": "",
     "category": "Object",
 }
-import bpy
+try:
+  import bpy
+  IN_BLENDER = True
+except ImportError:
+  #Not running inside Blender, e.g. the benchmarks. The dictionary
+  #code doesn't need bpy, so just give the Blender classes below
+  #something to be declared with. Nothing can be registered.
+  import types
+  bpy = types.SimpleNamespace(
+    types = types.SimpleNamespace(Panel=object, Operator=object, AddonPreferences=object, PropertyGroup=object, Object=object),
+    props = types.SimpleNamespace(IntProperty=dict, StringProperty=dict, PointerProperty=dict),
+  )
+  IN_BLENDER = False
+import array
+import bisect
+import collections
+import concurrent.futures
+import heapq
+import marshal
+import itertools
 import math
+import mmap
+import os
+import queue
 import re
+import sqlite3
 import string
+import subprocess
+import sys
+import tempfile
+import threading
+import zlib
+try:
+  import numpy
+except ImportError:
+  numpy = None      #Blender comes with it, but without it we plot a word at a time
 
 ###
 # Register the button-panel, the functions we'll use and the
 # user-editable variables like 'script location'.
 #
 def register():
+    bpy.utils.register_class(QuickTalk_Preferences)
+    bpy.utils.register_class(QuickTalk_VoiceArmature)
+    bpy.utils.register_class(QuickTalk_OverlayFile)
     bpy.utils.register_class(QuickTalk_AddQuicktalkPanel)
     bpy.utils.register_class(QuickTalk_BuildShapeKeyPanel)
     bpy.utils.register_class(QuickTalk_GuessDialogue)
     bpy.utils.register_class(QuickTalk_GuessLines)
     bpy.utils.register_class(QuickTalk_GuessWords)
     bpy.utils.register_class(QuickTalk_QuicktalkPlot)
+    bpy.utils.register_class(QuickTalk_QuicktalkPlotAll)
+    bpy.utils.register_class(QuickTalk_FillVoices)
+    bpy.utils.register_class(QuickTalk_AddVoice)
+    bpy.utils.register_class(QuickTalk_RemoveVoice)
+    bpy.utils.register_class(QuickTalk_AddOverlay)
+    bpy.utils.register_class(QuickTalk_RemoveOverlay)
     bpy.types.Scene.quicktalk_script_file = bpy.props.StringProperty (
       name = "Script File",
       default = "",
       description = "Where is the file defining the script?",
       subtype = 'FILE_PATH'
     )
+    bpy.types.Scene.quicktalk_script_text = bpy.props.PointerProperty (
+      name = "Script Text",
+      type = bpy.types.Text,
+      description = "Text in this blend file to read the script from instead of the script file"
+    )
+    bpy.types.Scene.quicktalk_voices = bpy.props.CollectionProperty (
+      name = "Voices",
+      type = QuickTalk_VoiceArmature,
+      description = "Which armature each of the script's voices is plotted to"
+    )
     bpy.types.Scene.quicktalk_dict_file = bpy.props.StringProperty (
       name = "Dictionary File",
       default = "",
       description = "Where is the file defining the phoneme dictionary?",
-      subtype = 'FILE_PATH'
+      subtype = 'FILE_PATH',
+      update = updatePreloadDictionary
+    )
+    bpy.types.Scene.quicktalk_overlays = bpy.props.CollectionProperty (
+      name = "Overlay Dictionaries",
+      type = QuickTalk_OverlayFile,
+      description = "Extra dictionary files whose words replace the main dictionary's. Later ones win"
     )
     bpy.types.Scene.quicktalk_bone_option = bpy.props.EnumProperty (
       items = (('0', 'X-Rotation', 'Create and move bones for X-Rotation'),    
@@ -139,23 +196,149 @@ def register():
                ('2', 'MHX2 Visemes', 'Plot curves using MHX2 visemes for MHX2 imported models')),
       name = "Bone Option",
       default = "0",
-      description = "Move/Make bones with rotation or translation?"
+      description = "Move/Make bones with rotation or translation?",
+      update = updatePreloadDictionary
     )
+    bpy.types.Scene.quicktalk_dict_mode = bpy.props.EnumProperty (
+      items = (('FULL', 'Whole Dictionary', 'Load the whole dictionary and keep it cached for later plots'),
+               ('SCRIPT', 'Script Words Only', 'Only read pronunciations for words in the script, quickest for short shots'),
+               ('INDEX', 'Memory-Mapped Index', 'Look words up straight from the file through a saved index, for very large dictionaries'),
+               ('SQLITE', 'SQLite Database', 'Import the dictionary into a database next to it and query just the script\'s words, for huge lexicons')),
+      name = "Dictionary Mode",
+      default = "FULL",
+      description = "How much of the dictionary to load when plotting",
+      update = updatePreloadDictionary
+    )
+    bpy.types.Scene.quicktalk_reduce_keys = bpy.props.BoolProperty (
+      name = "Simplify Keys",
+      default = False,
+      description = "After plotting, merge keys on the same frame and drop keys on flat stretches of the QuickTalk curves"
+    )
+    bpy.types.Scene.quicktalk_reduce_tolerance = bpy.props.FloatProperty (
+      name = "Simplify Tolerance",
+      default = 0.001,
+      min = 0.0,
+      description = "How far a key's value can be from its neighbours' and still count as flat"
+    )
+    #Pick up the saved preferences, if they exist yet.
+    addon = bpy.context.preferences.addons.get(__name__)
+    if(addon and addon.preferences):
+      updatePreferences(addon.preferences, bpy.context)
+    #Start loading dictionaries for whatever's open once Blender's
+    #ready, and again whenever a file's loaded.
+    bpy.app.handlers.load_post.append(bpy.app.handlers.persistent(preloadAllDictionaries))
+    bpy.app.timers.register(preloadAllDictionaries,first_interval=1.0)
 
 
 ###
 # Unregister it all when we're uninstalled
 #
 def unregister():
+    bpy.utils.unregister_class(QuickTalk_Preferences)
     bpy.utils.unregister_class(QuickTalk_AddQuicktalkPanel)
     bpy.utils.unregister_class(QuickTalk_BuildShapeKeyPanel)
     bpy.utils.unregister_class(QuickTalk_GuessDialogue)
     bpy.utils.unregister_class(QuickTalk_GuessLines)
     bpy.utils.unregister_class(QuickTalk_GuessWords)
     bpy.utils.unregister_class(QuickTalk_QuicktalkPlot)
+    bpy.utils.unregister_class(QuickTalk_QuicktalkPlotAll)
+    bpy.utils.unregister_class(QuickTalk_FillVoices)
+    bpy.utils.unregister_class(QuickTalk_AddVoice)
+    bpy.utils.unregister_class(QuickTalk_RemoveVoice)
+    bpy.utils.unregister_class(QuickTalk_AddOverlay)
+    bpy.utils.unregister_class(QuickTalk_RemoveOverlay)
     del bpy.types.Scene.quicktalk_script_file
+    del bpy.types.Scene.quicktalk_script_text
+    del bpy.types.Scene.quicktalk_voices
+    bpy.utils.unregister_class(QuickTalk_VoiceArmature)
     del bpy.types.Scene.quicktalk_dict_file 
+    del bpy.types.Scene.quicktalk_overlays
+    bpy.utils.unregister_class(QuickTalk_OverlayFile)
     del bpy.types.Scene.quicktalk_bone_option
+    del bpy.types.Scene.quicktalk_dict_mode
+    del bpy.types.Scene.quicktalk_reduce_keys
+    del bpy.types.Scene.quicktalk_reduce_tolerance
+    scriptCache.clear()
+    textBlockCache.clear()
+    markerIndexes.clear()
+    if(preloadAllDictionaries in bpy.app.handlers.load_post):
+      bpy.app.handlers.load_post.remove(preloadAllDictionaries)
+    if(bpy.app.timers.is_registered(preloadAllDictionaries)):
+      bpy.app.timers.unregister(preloadAllDictionaries)
+    if(bpy.app.timers.is_registered(collectPreloadedDictionaries)):
+      bpy.app.timers.unregister(collectPreloadedDictionaries)
+    dictionaryCache.clear()
+
+
+###
+# Add-on preferences, copied to where the dictionary code
+# (which may be on a preload thread) can see them.
+#
+def updatePreferences(self, context):
+    global dictionaryWorkers
+    dictionaryCache.setBudget(self.dictionary_cache_mb*1024*1024)
+    dictionaryWorkers = self.dictionary_workers
+
+class QuickTalk_Preferences(bpy.types.AddonPreferences):
+    bl_idname = __name__
+
+    dictionary_cache_mb: bpy.props.IntProperty (
+      name = "Dictionary Cache (MB)",
+      default = 256,
+      min = 1,
+      description = "How much memory parsed dictionaries may keep before the least recently used are dropped",
+      update = updatePreferences
+    )
+    dictionary_workers: bpy.props.IntProperty (
+      name = "Dictionary Parse Processes",
+      default = 0,
+      min = 0,
+      max = 64,
+      description = "Parse big dictionaries in this many processes at once. 0 or 1 parses in Blender itself",
+      update = updatePreferences
+    )
+
+    def draw(self, context):
+        self.layout.prop(self, "dictionary_cache_mb")
+        self.layout.prop(self, "dictionary_workers")
+
+
+###
+# One entry in a scene's voice registry: a voice from the script
+# and the armature its words are plotted to.
+#
+def isArmature(self, obj):
+    return obj.type == 'ARMATURE'
+
+class QuickTalk_VoiceArmature(bpy.types.PropertyGroup):
+    voice: bpy.props.StringProperty (
+      name = "Voice",
+      default = "",
+      description = "Name of the voice in the script"
+    )
+    armature: bpy.props.PointerProperty (
+      name = "Armature",
+      type = bpy.types.Object,
+      poll = isArmature,
+      description = "Armature to plot this voice's words to"
+    )
+
+
+###
+# One of a scene's overlay dictionaries. Changing it preloads the
+# scene's dictionaries again, like the other dictionary settings.
+#
+def updatePreloadOverlay(self, context):
+    preloadDictionary(self.id_data)
+
+class QuickTalk_OverlayFile(bpy.types.PropertyGroup):
+    path: bpy.props.StringProperty (
+      name = "Overlay Dictionary",
+      default = "",
+      description = "Extra dictionary file whose words replace the main dictionary's",
+      subtype = 'FILE_PATH',
+      update = updatePreloadOverlay
+    )
 
 
 ###
@@ -174,11 +357,29 @@ class QuickTalk_AddQuicktalkPanel(bpy.types.Panel):
         TheCol.prop(context.scene, "quicktalk_bone_option")
         TheCol.operator("object.quicktalk_addpanel", text="Build Shape-Key Panel Armature")
         TheCol.prop(context.scene, "quicktalk_script_file")
+        TheCol.prop(context.scene, "quicktalk_script_text")
         TheCol.operator("object.quicktalk_guess_dialogue", text="Guess Dialogue Markers")
         TheCol.operator("object.quicktalk_guess_lines", text="Guess Line Markers")
         TheCol.operator("object.quicktalk_guess_words", text="Guess Word Markers")
         TheCol.prop(context.scene, "quicktalk_dict_file")
+        for (index,entry) in enumerate(context.scene.quicktalk_overlays):
+          row = TheCol.row(align=True)
+          row.prop(entry, "path", text="")
+          row.operator("object.quicktalk_remove_overlay", text="", icon='X').index = index
+        TheCol.operator("object.quicktalk_add_overlay", text="Add Overlay Dictionary", icon='ADD')
+        TheCol.prop(context.scene, "quicktalk_dict_mode")
+        TheCol.prop(context.scene, "quicktalk_reduce_keys")
+        if(context.scene.quicktalk_reduce_keys):
+          TheCol.prop(context.scene, "quicktalk_reduce_tolerance")
         TheCol.operator("object.quicktalk_plot_timeline", text="Quicktalk Plot")
+        TheCol.operator("object.quicktalk_plot_all", text="Quicktalk Plot All Voices")
+        TheCol.operator("object.quicktalk_fill_voices", text="Fill In Voice Armatures")
+        for (index,entry) in enumerate(context.scene.quicktalk_voices):
+          row = TheCol.row(align=True)
+          row.prop(entry, "voice", text="")
+          row.prop(entry, "armature", text="")
+          row.operator("object.quicktalk_remove_voice", text="", icon='X').index = index
+        TheCol.operator("object.quicktalk_add_voice", text="Add Voice", icon='ADD')
 
 
 ###
@@ -361,91 +562,1950 @@ class QuickTalk_BuildShapeKeyPanel(bpy.types.Operator):
 
 
 
+###
+# Compiled dictionary cache.
+# Parsing the whole CMU file takes seconds, so once we've parsed
+# it we marshal the result (as phonemes, so it serves every mapping
+# profile) to a file next to the dictionary. The header records the source's path, size
+# and mtime so a changed dictionary gets re-parsed automatically.
+# If we can't write next to the dictionary we use the temp dir.
+#
+DICTIONARY_CACHE_VERSION = 4
+
+def cacheFilePaths(path,suffix):
+  name = os.path.basename(path)+"."+suffix
+  tmpname = "quicktalk-%08x-%s" % (zlib.crc32(path.encode("utf-8")),name)
+  return [path+"."+suffix, os.path.join(tempfile.gettempdir(),tmpname)]
+
+def dictionaryCacheKey(path,kind):
+  st = os.stat(path)
+  return (DICTIONARY_CACHE_VERSION, path, st.st_size, st.st_mtime_ns, kind)
+
+###
+# Load whatever was cached for a dictionary file, or None if
+# there isn't an up-to-date cache file with that key.
+#
+def readCacheFile(path,suffix,key):
+  for cachePath in cacheFilePaths(path,suffix):
+    try:
+      with open(cachePath,"rb") as f:
+        if(marshal.load(f) != key):
+          continue
+        return marshal.loads(f.read())    #much quicker than load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+      continue
+  return None
+
+###
+# Save a cache file. It's written under a temporary name and
+# renamed so another Blender never sees half of one.
+#
+def writeCacheFile(path,suffix,key,data):
+  for cachePath in cacheFilePaths(path,suffix):
+    tmpPath = cachePath+".%d-%d.tmp" % (os.getpid(),threading.get_ident())
+    try:
+      with open(tmpPath,"wb") as f:
+        marshal.dump(key,f)
+        marshal.dump(data,f)
+      os.replace(tmpPath,cachePath)
+      return cachePath
+    except OSError:
+      try:
+        os.remove(tmpPath)
+      except OSError:
+        pass
+  print("Can't write "+suffix+" cache for "+path)
+  return None
+
+def loadCompiledDictionary(path):
+  packed = readCacheFile(path,"qtcache",dictionaryCacheKey(path,"phonemes"))
+  if(packed is None):
+    return None
+  return QuickTalk_PhonemeTable.unpack(packed)
+
+def saveCompiledDictionary(path,dictionary):
+  return writeCacheFile(path,"qtcache",dictionaryCacheKey(path,"phonemes"),dictionary.pack())
+
+
+###
+# Every viseme any mapping can produce gets a small integer code,
+# and pronunciations are stored as strings of those codes rather
+# than lists of names. The plotting works on the codes directly
+# and only looks the name up when it needs the bone.
+#
+VISEMES = ["Rest","AI","O","E","U","ETC","L","WQ","MBP","FV","TH",
+           "AH","Etc","EH","EE","G","OO","R","S","SH"]
+VISEME_CODES = dict((v,i) for i,v in enumerate(VISEMES))
+
+###
+# The ARPAbet phonemes used by CMU-format dictionaries, with or
+# without a stress digit. Dictionaries are parsed into codes for
+# these, which don't depend on the bone option, and only mapped to
+# visemes for a particular profile afterwards.
+#
+PHONEMES = ["AA","AE","AH","AO","AW","AY","B","CH","D","DH","EH","ER",
+            "EY","F","G","HH","IH","IY","JH","K","L","M","N","NG","OW",
+            "OY","P","R","S","SH","T","TH","UH","UW","V","W","Y","Z","ZH",
+            "E21"]
+PHONEME_CODES = dict((p+stress,i) for i,p in enumerate(PHONEMES) for stress in ("","0","1","2"))
+
+###
+# Phoneme -> viseme mapping profiles. These are mostly ripped
+# out of the Papagayo source code. Add a profile here and pick
+# it in LoadDictionary to support another rig.
+#
+MAPPING_PROFILES = {
+  "standard": {
+    "AA":"AI",  "AE":"AI",  "AH":"AI",  "AO":"O",   "AW":"O",   "AY":"AI",
+    "B":"MBP",  "CH":"ETC", "D":"ETC",  "DH":"ETC", "EH":"E",   "ER":"E",
+    "EY":"E",   "F":"FV",   "G":"ETC",  "HH":"ETC", "IH":"AI",  "IY":"E",
+    "JH":"ETC", "K":"ETC",  "L":"L",    "M":"MBP",  "N":"ETC",  "NG":"ETC",
+    "OW":"O",   "OY":"WQ",  "P":"MBP",  "R":"ETC",  "S":"ETC",  "SH":"ETC",
+    "T":"ETC",  "TH":"TH",  "UH":"U",   "UW":"U",   "V":"FV",   "W":"WQ",
+    "Y":"ETC",  "Z":"ETC",  "ZH":"ETC", "E21":"E",
+  },
+  #Alternate mappings for MHX2 import
+  "mhx2": {
+    "AA":"AH",  "AE":"AH",  "AH":"AH",  "AO":"O",   "AW":"O",   "AY":"AH",
+    "B":"MBP",  "CH":"Etc", "D":"Etc",  "DH":"Etc", "EH":"EH",  "ER":"EH",
+    "EY":"EE",  "F":"FV",   "G":"G",    "HH":"Etc", "IH":"AH",  "IY":"EE",
+    "JH":"Etc", "K":"Etc",  "L":"L",    "M":"MBP",  "N":"Etc",  "NG":"Etc",
+    "OW":"O",   "OY":"OO",  "P":"MBP",  "R":"R",    "S":"S",    "SH":"SH",
+    "T":"Etc",  "TH":"TH",  "UH":"OO",  "UW":"OO",  "V":"FV",   "W":"OO",
+    "Y":"Etc",  "Z":"Etc",  "ZH":"Etc", "E21":"EE",
+  },
+}
+
+###
+# Compile a profile, once, into a 256-byte table from phoneme
+# code to viseme code, which bytes.translate() can apply to a
+# whole dictionary's buffer in one go.
+#
+compiledProfiles = {}
+
+def compileProfile(profile):
+  if profile not in compiledProfiles:
+    mapping = MAPPING_PROFILES[profile]
+    table = bytearray(256)
+    for i,p in enumerate(PHONEMES):
+      table[i] = VISEME_CODES[mapping[p]]
+    compiledProfiles[profile] = bytes(table)
+  return compiledProfiles[profile]
+
+###
+# Turn a dictionary entry's phoneme names into phoneme codes.
+# Anything that isn't ARPAbet is reported and left out.
+#
+def phonemeCodes(tokens,word):
+  codes = bytearray()
+  for p in tokens:
+    if p in PHONEME_CODES:
+      codes.append(PHONEME_CODES[p])
+    else:
+      print("Unknown phoneme:", p, "in word:", word)
+  return bytes(codes)
+
+###
+# The same for phoneme names still as bytes, straight from the
+# file. Nearly every entry is all ARPAbet, so try that quickly
+# first and only decode things to complain about them.
+#
+PHONEME_BYTE_CODES = dict((p.encode("ascii"),i) for p,i in PHONEME_CODES.items())
+
+def phonemeByteCodes(tokens,word):
+  try:
+    return bytes(map(PHONEME_BYTE_CODES.__getitem__,tokens))
+  except KeyError:
+    return phonemeCodes([p.decode("utf-8","replace") for p in tokens],word.decode("utf-8","replace"))
+
+###
+# Normalise a headword the same way as the script's words (lower
+# case, only letters and digits) with one bytes.translate. The
+# few non-ASCII headwords go through the regex instead.
+#
+HEADWORD_LOWER = bytes.maketrans(string.ascii_uppercase.encode("ascii"),string.ascii_lowercase.encode("ascii"))
+HEADWORD_DELETE = bytes(c for c in range(128) if not chr(c).isalnum())
+
+def normaliseHeadword(word):
+  if(word.isascii()):
+    return word.translate(HEADWORD_LOWER,HEADWORD_DELETE).decode("ascii")
+  return re.sub(r'[\W_]+', '', word.decode("utf-8","replace")).lower()
+
+###
+# A parsed dictionary in compact form. All pronunciations are
+# packed end to end in one buffer of viseme codes, and each word
+# maps to its entry number in a table of offsets into it, so an
+# entry costs a few bytes plus its key. Looks like a read-only
+# dict of word -> bytes of viseme codes.
+#
+class QuickTalk_PhonemeTable:
+
+  def __init__(self):
+      self.words = {}                        # word -> entry number
+      self.offsets = array.array("I",[0])    # entry number -> start in data
+      self.data = bytearray()
+
+  ###
+  # Add a word. If it's already there the new pronunciation
+  # wins and the old one is just left unused in the buffer.
+  #
+  def add(self,word,codes):
+      self.words[word] = len(self.offsets)-1
+      self.data.extend(codes)
+      self.offsets.append(len(self.data))
+
+  ###
+  # Add a list of (word, codes) at once, much quicker than add()
+  # for each of them when loading a whole file.
+  #
+  def addEntries(self,entries):
+      if(len(entries) == 0):
+        return
+      (words,codes) = zip(*entries)
+      first = len(self.offsets)-1
+      self.words.update(zip(words,range(first,first+len(words))))
+      ends = itertools.accumulate(map(len,codes),initial=len(self.data))
+      next(ends)     #That's where the first one starts
+      self.offsets.extend(ends)
+      self.data.extend(b"".join(codes))
+
+  ###
+  # Append everything in another table. Its words win.
+  #
+  def extend(self,other):
+      first = len(self.offsets)-1
+      start = len(self.data)
+      self.words.update((word,i+first) for word,i in other.words.items())
+      self.offsets.extend(offset+start for offset in other.offsets[1:])
+      self.data.extend(other.data)
+
+  def __getitem__(self,word):
+      i = self.words[word]
+      return bytes(self.data[self.offsets[i]:self.offsets[i+1]])
+
+  def __contains__(self,word):
+      return word in self.words
+
+  def __len__(self):
+      return len(self.words)
+
+  def get(self,word,default=None):
+      if word in self.words:
+        return self[word]
+      return default
+
+  def keys(self):
+      return self.words.keys()
+
+  ###
+  # A copy with every code put through a translation table,
+  # e.g. from phoneme codes to a profile's viseme codes.
+  #
+  def translate(self,table):
+      mapped = QuickTalk_PhonemeTable()
+      mapped.words = dict(self.words)
+      mapped.offsets = array.array("I",self.offsets)
+      mapped.data = self.data.translate(table)
+      return mapped
+
+  ###
+  # Memory use, counting each key as an ASCII str
+  #
+  def memorySize(self):
+      size = sys.getsizeof(self.words) + sys.getsizeof(self.data)
+      size = size + sum(map(len,self.words)) + sys.getsizeof("")*len(self.words)
+      return size + self.offsets.itemsize*len(self.offsets)
+
+  ###
+  # Plain values for marshal, and back again.
+  #
+  def pack(self):
+      return (self.words, self.offsets.tobytes(), bytes(self.data))
+
+  @classmethod
+  def unpack(cls,packed):
+      (words, offsets, data) = packed
+      table = cls()
+      table.words = words
+      table.offsets = array.array("I")
+      table.offsets.frombytes(offsets)
+      table.data = bytearray(data)
+      return table
+
+
+###
+# Read a dictionary file, or the part of it from start up to
+# end, in big binary chunks, yielding a list of whole lines (as
+# bytes) for each chunk.
+#
+DICTIONARY_CHUNK_SIZE = 1024*1024
+
+def dictionaryChunks(path,start=0,end=None):
+  with open(path,"rb") as inFile:
+    inFile.seek(start)
+    tail = b""
+    while True:
+      size = DICTIONARY_CHUNK_SIZE
+      if(end is not None):
+        size = min(size,end-inFile.tell())
+      chunk = inFile.read(size)
+      if(len(chunk) == 0):
+        break
+      lines = (tail+chunk).split(b"\n")
+      tail = lines.pop()
+      yield lines
+    if(len(tail) > 0):
+      yield [tail]
+
+###
+# Read the entries of a CMU-format dictionary file, yielding a
+# list of (word, phoneme codes) for each chunk. Comments and the
+# alternative pronunciations, like "WORD(2)", are skipped on the
+# raw bytes without splitting them up or decoding them.
+#
+def dictionaryEntries(path,start=0,end=None):
+  codeOf = PHONEME_BYTE_CODES.__getitem__
+  for lines in dictionaryChunks(path,start,end):
+    entries = []
+    for line in lines:
+      if((not line) or (line[0] == 35)):       # '#' comment
+        continue
+      entry = line.split()
+      if((not entry) or (entry[0][-1] == 41)):  # ')' variant
+        continue
+      #This is the hot loop, so normaliseHeadword and
+      #phonemeByteCodes are done inline for the usual case.
+      word = entry[0]
+      try:
+        codes = bytes(map(codeOf,entry[1:]))
+      except KeyError:
+        codes = phonemeByteCodes(entry[1:],word)
+      if(codes):
+        if(word.isascii()):
+          entries.append((word.translate(HEADWORD_LOWER,HEADWORD_DELETE).decode("ascii"),codes))
+        else:
+          entries.append((normaliseHeadword(word),codes))
+    yield entries
+
+###
+# Parse a CMU-format dictionary file into a table of
+# word -> phoneme codes.
+#
+def parseDictionaryFile(path):
+  if((dictionaryWorkers > 1) and (os.path.getsize(path) > dictionaryWorkers*PARALLEL_MIN_BYTES)):
+    return parseDictionaryParallel(path,dictionaryWorkers)
+  dictionary = QuickTalk_PhonemeTable()
+  for entries in dictionaryEntries(path):
+    dictionary.addEntries(entries)
+  return dictionary
+
+###
+# Big dictionaries can be parsed in several processes at once.
+# The file is split into byte ranges at line boundaries, each
+# range is parsed on its own, and the tables are joined back up
+# in file order so later duplicates still win. Outside Blender we
+# use a process pool. Inside Blender we don't want it forking or
+# re-launching Blender, so each range gets its own plain Python
+# (Blender's bundled one) running this file as a script.
+#
+dictionaryWorkers = 0                 #From the add-on preferences
+PARALLEL_MIN_BYTES = 1024*1024        #Not worth a process for less
+
+###
+# Split a file into up to n ranges that each start on a line
+#
+def dictionaryRanges(path,n):
+  size = os.path.getsize(path)
+  starts = [0]
+  with open(path,"rb") as inFile:
+    for i in range(1,n):
+      inFile.seek(max(size*i//n,starts[-1]))
+      inFile.readline()
+      if(inFile.tell() < size):
+        starts.append(inFile.tell())
+  starts = sorted(set(starts))
+  return list(zip(starts,starts[1:]+[size]))
+
+def parseDictionaryRange(path,start,end):
+  dictionary = QuickTalk_PhonemeTable()
+  for entries in dictionaryEntries(path,start,end):
+    dictionary.addEntries(entries)
+  return dictionary.pack()
+
+def parseDictionaryParallel(path,workers):
+  ranges = dictionaryRanges(path,workers)
+  if(IN_BLENDER):
+    parts = parseRangesInSubprocesses(path,ranges)
+  else:
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+      parts = list(pool.map(parseDictionaryRange,[path]*len(ranges),*zip(*ranges)))
+  dictionary = QuickTalk_PhonemeTable()
+  for packed in parts:
+    dictionary.extend(QuickTalk_PhonemeTable.unpack(packed))
+  return dictionary
+
+def parseRangesInSubprocesses(path,ranges):
+  workers = []
+  for (start,end) in ranges:
+    workers.append(subprocess.Popen([sys.executable,"-I",os.path.abspath(__file__),"--parse-range",path,str(start),str(end)],
+                                    stdout=subprocess.PIPE))
+  parts = []
+  for worker in workers:
+    (output,errors) = worker.communicate()
+    if(worker.returncode != 0):
+      raise OSError("Dictionary parse process failed for "+path)
+    parts.append(marshal.loads(output))
+  return parts
+
+###
+# The (normalised) headwords of a dictionary file, and how many
+# entries each of the ones that turn up more than once has, found
+# with one regex over the raw bytes rather than a full parse. The
+# duplicates are what tell a partial parse it can stop looking for
+# a word. Saved next to the dictionary like the others.
+#
+class QuickTalk_Headwords:
+
+  headword = re.compile(rb'^(?!#)[^\S\n]*(\S+)',re.M)
+
+  def __init__(self,path):
+      key = dictionaryCacheKey(path,"headwords")
+      saved = readCacheFile(path,"qtwords",key)
+      if(saved is None):
+        saved = self.build(path)
+        writeCacheFile(path,"qtwords",key,saved)
+      (words,self.duplicates) = saved
+      self.words = words.decode("utf-8").split("\n") if words else []
+
+  def build(self,path):
+      with open(path,"rb") as f:
+        data = f.read()
+      counts = collections.Counter(normaliseHeadword(w) for w in self.headword.findall(data) if not w.endswith(b")"))
+      duplicates = dict((w,n) for (w,n) in counts.items() if n > 1)
+      return ("\n".join(sorted(counts)).encode("utf-8"), duplicates)
+
+  def memorySize(self):
+      return sys.getsizeof(self.words) + sum(map(len,self.words)) + sys.getsizeof("")*len(self.words) + sys.getsizeof(self.duplicates)
+
+def loadHeadwordSummary(path):
+  return getCachedDictionary(dictionaryCacheKey(path,"headwords"),QuickTalk_Headwords,path)
+
+###
+# Read only the entries for the given words from a dictionary
+# file, stopping as soon as every one of them has been found.
+# Nothing else is parsed, so this is much quicker than reading
+# the whole thing for a script with a few hundred words.
+#
+HEADWORD_DELETE_LINES = HEADWORD_DELETE.replace(b"\n",b"")
+
+def parseDictionaryWords(path,profile,words):
+  table = compileProfile(profile)
+  dictionary = QuickTalk_PhonemeTable()
+  remaining = set(w.encode("utf-8") for w in words)
+  duplicates = loadHeadwordSummary(path).duplicates
+  seen = {}         # duplicated word -> entries of it read so far
+  for lines in dictionaryChunks(path):
+    if(len(remaining)==0):
+      break
+    #Normalise the chunk's headwords all in one translate, and only
+    #split up the lines of the ones we want.
+    heads = [(line.split(None,1) or [b""])[0] for line in lines]
+    joined = b"\n".join(heads)
+    names = joined.translate(HEADWORD_LOWER,HEADWORD_DELETE_LINES).split(b"\n")
+    if(not joined.isascii()):
+      for i in range(len(heads)):
+        if(not heads[i].isascii()):
+          names[i] = normaliseHeadword(heads[i]).encode("utf-8")
+    if(remaining.isdisjoint(names)):
+      continue
+    for i in itertools.compress(itertools.count(),map(remaining.__contains__,names)):
+      name = names[i]
+      line = lines[i]
+      if((line[0] == 35) or (heads[i][-1] == 41)):   # '#' comment or ')' variant
+        continue
+      #Later duplicates still win, same as the full parse, so a
+      #word's only done with once its last entry has been read.
+      word = name.decode("utf-8")
+      codes = phonemeByteCodes(line.split()[1:],heads[i])
+      if(len(codes) > 0):
+        dictionary.add(word,codes.translate(table))
+      seen[word] = seen.get(word,0) + 1
+      if(seen[word] >= duplicates.get(word,1)):
+        remaining.discard(name)
+  return dictionary
+
+
+###
+# In-memory cache of parsed dictionaries shared by every script,
+# so switching between scenes with different dictionaries (or
+# bone options) only costs anything the first time. Entries are
+# keyed like the compiled files, so an edited dictionary can never
+# be served stale, and the least recently used ones are dropped
+# once the memory budget (in the add-on preferences) is exceeded.
+#
+class QuickTalk_DictionaryCache:
+
+  def __init__(self,budget):
+      self.budget = budget
+      self.entries = collections.OrderedDict()    # key -> (dictionary,size)
+      self.size = 0
+
+  ###
+  # Memory use of a cached dictionary
+  #
+  def estimateSize(self,dictionary):
+      return dictionary.memorySize()
+
+  def get(self,key):
+      if key not in self.entries:
+        return None
+      self.entries.move_to_end(key)
+      return self.entries[key][0]
+
+  def put(self,key,dictionary):
+      if((key in self.entries) and (self.entries[key][0] is not dictionary)):
+        self.discard(key)
+      elif(key in self.entries):
+        self.size = self.size - self.entries.pop(key)[1]
+      size = self.estimateSize(dictionary)
+      self.entries[key] = (dictionary,size)
+      self.size = self.size + size
+      self.evict()
+
+  def discard(self,key):
+      if key in self.entries:
+        (dictionary,size) = self.entries.pop(key)
+        self.size = self.size - size
+        self.release(dictionary)
+
+  def clear(self):
+      for (dictionary,size) in self.entries.values():
+        self.release(dictionary)
+      self.entries.clear()
+      self.size = 0
+
+  ###
+  # Close whatever a dropped dictionary has open, if anything
+  #
+  def release(self,dictionary):
+      if(hasattr(dictionary,"close")):
+        dictionary.close()
+
+  def setBudget(self,budget):
+      self.budget = budget
+      self.evict()
+
+  ###
+  # Drop least recently used dictionaries until we're in budget,
+  # but always keep the newest one even if it's too big alone.
+  #
+  def evict(self):
+      while self.size > self.budget and len(self.entries) > 1:
+        key, (dictionary,size) = self.entries.popitem(last=False)
+        self.size = self.size - size
+        self.release(dictionary)
+
+dictionaryCache = QuickTalk_DictionaryCache(256*1024*1024)
+
+###
+# Dictionaries can be loaded on worker threads as soon as the
+# dictionary file is picked, rather than when Plot is pressed.
+# Workers never touch bpy or the shared cache, they just build the
+# dictionary and queue it. A bpy.app.timers callback on the main
+# thread moves finished ones into the cache, and a plot that wants
+# one that's still loading waits for that worker.
+#
+class QuickTalk_DictionaryPreloader:
+
+  def __init__(self):
+      self.jobs = {}                   # cache key -> worker thread
+      self.results = queue.Queue()     # (cache key, dictionary or error)
+
+  def start(self,key,build,*args):
+      if((key in self.jobs) or (dictionaryCache.get(key) is not None)):
+        return
+      thread = threading.Thread(target=self.run,args=(key,build,args),daemon=True)
+      self.jobs[key] = thread
+      thread.start()
+      if(not bpy.app.timers.is_registered(collectPreloadedDictionaries)):
+        bpy.app.timers.register(collectPreloadedDictionaries,first_interval=0.2)
+
+  def run(self,key,build,args):
+      try:
+        self.results.put((key,build(*args)))
+      except Exception as e:
+        self.results.put((key,e))
+
+  ###
+  # Move finished dictionaries into the cache. Main thread only.
+  #
+  def collect(self):
+      while(not self.results.empty()):
+        (key,result) = self.results.get()
+        self.jobs.pop(key,None)
+        if(isinstance(result,Exception)):
+          print("Couldn't preload dictionary "+key[1]+": "+str(result))
+        else:
+          dictionaryCache.put(key,result)
+
+  ###
+  # Wait for a dictionary that's being preloaded, returns
+  # None if it isn't (or it failed).
+  #
+  def wait(self,key):
+      thread = self.jobs.get(key)
+      if(thread is None):
+        return None
+      thread.join()
+      self.collect()
+      return dictionaryCache.get(key)
+
+dictionaryPreloader = QuickTalk_DictionaryPreloader()
+
+def collectPreloadedDictionaries():
+  dictionaryPreloader.collect()
+  if(len(dictionaryPreloader.jobs) > 0):
+    return 0.2
+  return None
+
+###
+# Get a dictionary from the cache, from a preload in progress,
+# or by building it now.
+#
+def getCachedDictionary(key,build,*args):
+  dictionary = dictionaryCache.get(key)
+  if(dictionary is None):
+    dictionary = dictionaryPreloader.wait(key)
+  if(dictionary is None):
+    dictionary = build(*args)
+    dictionaryCache.put(key,dictionary)
+  return dictionary
+
+###
+# Build the dictionary for a file and mapping profile. The
+# phonemes come from the compiled file, or by parsing it, and are
+# mapped to the profile's visemes in one translate.
+#
+def buildPhonemeDictionary(path,profile):
+  phonemes = loadCompiledDictionary(path)
+  if(phonemes is None):
+    phonemes = parseDictionaryFile(path)
+    saveCompiledDictionary(path,phonemes)
+  return phonemes.translate(compileProfile(profile))
+
+def loadPhonemeDictionary(path,profile):
+  return getCachedDictionary(dictionaryCacheKey(path,profile),buildPhonemeDictionary,path,profile)
+
+
+###
+# A dictionary that is never parsed into memory. The file is
+# memory-mapped and we keep a sorted table of the offsets of its
+# entry lines, so a lookup is a binary search over the mapped
+# bytes. The table is 4 bytes per entry and is saved next to the
+# dictionary so it's only built once per version of the file.
+# Works like a read-only dict of word -> bytes of viseme codes.
+#
+class QuickTalk_IndexedDictionary:
+
+  headword = re.compile(rb'\S+')
+
+  def __init__(self,path,profile):
+      self.path = path
+      self.table = compileProfile(profile)
+      self.open()
+      self.offsets = self.loadIndex()
+
+  def open(self):
+      self.file = open(self.path,"rb")
+      self.size = os.fstat(self.file.fileno()).st_size
+      self.data = b""
+      if(self.size > 0):
+        self.data = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+
+  ###
+  # Let go of the file and its mapping, when the cache drops us.
+  # A script still holding us just opens it again.
+  #
+  def close(self):
+      if(self.file is None):
+        return
+      if(isinstance(self.data,mmap.mmap)):
+        self.data.close()
+      self.file.close()
+      self.file = None
+      self.data = None
+
+  ###
+  # Normalised headword at an offset
+  #
+  def wordAt(self,offset):
+      return normaliseHeadword(self.headword.match(self.data,offset).group(0))
+
+  ###
+  # Get the saved offset table, or scan the file to build one.
+  # The offsets are of the headwords, past any indentation. Later
+  # duplicates replace earlier ones and entries with no phonemes
+  # we know are left out, same as a full parse.
+  #
+  def loadIndex(self):
+      key = dictionaryCacheKey(self.path,"index")
+      typecode = "I"
+      if(self.size >= 2**32):
+        typecode = "Q"
+      saved = readCacheFile(self.path,"qtindex",key)
+      if(saved is not None):
+        return array.array(typecode,saved)
+
+      entries = {}
+      offset = 0
+      while offset < self.size:
+        end = self.data.find(b"\n",offset)
+        if(end < 0):
+          end = self.size
+        line = self.data[offset:end]
+        entry = line.split()
+        if((not line.startswith(b"#")) and (len(entry) > 0) and (not entry[0].endswith(b")")) and (len(phonemeByteCodes(entry[1:],entry[0])) > 0)):
+          entries[normaliseHeadword(entry[0])] = offset + line.index(entry[0])
+        offset = end + 1
+      offsets = array.array(typecode,[entries[w] for w in sorted(entries)])
+      writeCacheFile(self.path,"qtindex",key,offsets.tobytes())
+      return offsets
+
+  ###
+  # Binary search for a word, returns the offset of its line or -1
+  #
+  def find(self,word):
+      if(self.file is None):
+        self.open()
+      lo = 0
+      hi = len(self.offsets)
+      while lo < hi:
+        mid = (lo+hi)//2
+        if(self.wordAt(self.offsets[mid]) < word):
+          lo = mid + 1
+        else:
+          hi = mid
+      if((lo < len(self.offsets)) and (self.wordAt(self.offsets[lo]) == word)):
+        return self.offsets[lo]
+      return -1
+
+  def __contains__(self,word):
+      return self.find(word) >= 0
+
+  def __getitem__(self,word):
+      offset = self.find(word)
+      if(offset < 0):
+        raise KeyError(word)
+      end = self.data.find(b"\n",offset)
+      if(end < 0):
+        end = self.size
+      entry = self.data[offset:end].decode("utf-8","replace").split()
+      return phonemeCodes(entry[1:],entry[0]).translate(self.table)
+
+  def get(self,word,default=None):
+      try:
+        return self[word]
+      except KeyError:
+        return default
+
+  def __len__(self):
+      return len(self.offsets)
+
+  def memorySize(self):
+      return sys.getsizeof(self) + self.offsets.itemsize*len(self.offsets)
+
+###
+# Get the indexed dictionary for a file, kept in the shared
+# cache so the index is only loaded once per session.
+#
+def loadIndexedDictionary(path,profile):
+  return getCachedDictionary(dictionaryCacheKey(path,profile+"-index"),QuickTalk_IndexedDictionary,path,profile)
+
+###
+# A dictionary imported into an SQLite database next to the file,
+# with the words as an indexed primary key, for lexicons too big
+# to want in memory at all. lookupWords() fetches every word a
+# script needs in one IN (...) query and gives back an ordinary
+# table of them. The database records the source file's size and
+# mtime and is re-imported when that changes.
+#
+class QuickTalk_SqliteDictionary:
+
+  batchSize = 900     #Old SQLite builds allow at most 999 parameters
+
+  def __init__(self,path,profile):
+      self.path = path
+      self.table = compileProfile(profile)
+      self.db = self.open()
+
+  ###
+  # Open the up-to-date database, importing the file if needed.
+  # It may be opened on a preload thread but used on the main one.
+  #
+  def open(self):
+      key = repr(dictionaryCacheKey(self.path,"sqlite"))
+      for dbPath in cacheFilePaths(self.path,"qtdb"):
+        if(not os.path.exists(dbPath)):
+          continue
+        try:
+          db = sqlite3.connect(dbPath,check_same_thread=False)
+          if(db.execute("SELECT value FROM meta WHERE name='key'").fetchone() == (key,)):
+            return db
+          db.close()
+        except sqlite3.Error:
+          pass
+      for dbPath in cacheFilePaths(self.path,"qtdb"):
+        tmpPath = dbPath+".%d-%d.tmp" % (os.getpid(),threading.get_ident())
+        try:
+          self.importDictionary(tmpPath,key)
+          os.replace(tmpPath,dbPath)
+          return sqlite3.connect(dbPath,check_same_thread=False)
+        except (OSError, sqlite3.Error):
+          try:
+            os.remove(tmpPath)
+          except OSError:
+            pass
+      raise OSError("Can't create dictionary database for "+self.path)
+
+  def importDictionary(self,dbPath,key):
+      db = sqlite3.connect(dbPath)
+      try:
+        db.execute("PRAGMA journal_mode=OFF")
+        db.execute("PRAGMA synchronous=OFF")
+        db.execute("CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT)")
+        db.execute("CREATE TABLE entries (word TEXT PRIMARY KEY, phonemes BLOB) WITHOUT ROWID")
+        #Later duplicates replace earlier ones, same as the other modes
+        for entries in dictionaryEntries(self.path):
+          db.executemany("INSERT OR REPLACE INTO entries VALUES (?,?)",entries)
+        db.execute("INSERT INTO meta VALUES ('key',?)",(key,))
+        db.commit()
+      finally:
+        db.close()
+
+  ###
+  # Fetch a batch of words, returns a table of the ones found
+  #
+  def lookupWords(self,words):
+      found = QuickTalk_PhonemeTable()
+      words = list(set(words))
+      for i in range(0,len(words),self.batchSize):
+        batch = words[i:i+self.batchSize]
+        query = "SELECT word, phonemes FROM entries WHERE word IN (%s)" % ",".join("?"*len(batch))
+        for (word,codes) in self.db.execute(query,batch):
+          found.add(word,codes.translate(self.table))
+      return found
+
+  def __getitem__(self,word):
+      row = self.db.execute("SELECT phonemes FROM entries WHERE word=?",(word,)).fetchone()
+      if(row is None):
+        raise KeyError(word)
+      return row[0].translate(self.table)
+
+  def __contains__(self,word):
+      return self.db.execute("SELECT 1 FROM entries WHERE word=?",(word,)).fetchone() is not None
+
+  def get(self,word,default=None):
+      try:
+        return self[word]
+      except KeyError:
+        return default
+
+  def memorySize(self):
+      return sys.getsizeof(self)
+
+def loadSqliteDictionary(path,profile):
+  return getCachedDictionary(dictionaryCacheKey(path,profile+"-sqlite"),QuickTalk_SqliteDictionary,path,profile)
+
+
+###
+# A stack of dictionaries looked up top down, so production
+# specific overlays can replace or add to the main dictionary
+# without copying it. Every layer is loaded and cached on its own,
+# so editing an overlay only re-parses that overlay.
+#
+class QuickTalk_LayeredDictionary:
+
+  def __init__(self,layers):
+      self.layers = layers      # main dictionary first, last overlay wins
+
+  def __getitem__(self,word):
+      for layer in reversed(self.layers):
+        if word in layer:
+          return layer[word]
+      raise KeyError(word)
+
+  def __contains__(self,word):
+      for layer in self.layers:
+        if word in layer:
+          return True
+      return False
+
+  def get(self,word,default=None):
+      try:
+        return self[word]
+      except KeyError:
+        return default
+
+###
+# The overlay files listed for a scene, in order
+#
+def getOverlayPaths(scene):
+  paths = []
+  for entry in scene.quicktalk_overlays:
+    if(entry.path.strip() != ""):
+      paths.append(os.path.abspath(bpy.path.abspath(entry.path.strip())))
+  return paths
+
+###
+# Where a scene's dictionary is and which profile maps it
+#
+def getDictionarySettings(scene):
+  profile = "standard"
+  if(scene.quicktalk_bone_option == "2"):
+    profile = "mhx2"
+  return (os.path.abspath(bpy.path.abspath(scene.quicktalk_dict_file)), profile)
+
+###
+# Start loading a scene's dictionary in the background, if its
+# mode is one that loads something up front.
+#
+def preloadDictionary(scene):
+  if(scene.quicktalk_dict_file == ""):
+    return
+  (path,profile) = getDictionarySettings(scene)
+  try:
+    if(scene.quicktalk_dict_mode == "FULL"):
+      dictionaryPreloader.start(dictionaryCacheKey(path,profile),buildPhonemeDictionary,path,profile)
+    elif(scene.quicktalk_dict_mode == "INDEX"):
+      dictionaryPreloader.start(dictionaryCacheKey(path,profile+"-index"),QuickTalk_IndexedDictionary,path,profile)
+    elif(scene.quicktalk_dict_mode == "SQLITE"):
+      dictionaryPreloader.start(dictionaryCacheKey(path,profile+"-sqlite"),QuickTalk_SqliteDictionary,path,profile)
+    for overlay in getOverlayPaths(scene):
+      dictionaryPreloader.start(dictionaryCacheKey(overlay,profile),buildPhonemeDictionary,overlay,profile)
+  except OSError:
+    pass    #No such file (yet), we'll complain if they try to plot with it
+
+def updatePreloadDictionary(self, context):
+  preloadDictionary(self)       #The scene whose setting changed
+
+def preloadAllDictionaries(*args):
+  for scene in bpy.data.scenes:
+    preloadDictionary(scene)
+  return None
+
+
+###
+# All the (normalised) words in a dictionary file, from its saved
+# headword summary, so nothing has to parse the whole dictionary
+# just to know what's in it.
+#
+def loadHeadwords(path):
+  return loadHeadwordSummary(path).words
+
+###
+# Edit distance between two words, counting swapping two letters
+# next to each other ("recieve") as one edit, giving up (returning
+# limit+1) once it can't be within limit.
+#
+def editDistance(a,b,limit):
+  if(abs(len(a)-len(b)) > limit):
+    return limit+1
+  before = None
+  previous = list(range(len(b)+1))
+  for i in range(1,len(a)+1):
+    current = [i]+[0]*len(b)
+    for j in range(1,len(b)+1):
+      current[j] = min(previous[j]+1, current[j-1]+1, previous[j-1]+(a[i-1] != b[j-1]))
+      if((i > 1) and (j > 1) and (a[i-1] == b[j-2]) and (a[i-2] == b[j-1])):
+        current[j] = min(current[j], before[j-2]+1)
+    if((min(current) > limit) and (min(previous) >= limit)):
+      return limit+1
+    before = previous
+    previous = current
+  return previous[-1]
+
+###
+# Index of a dictionary's headwords for finding the nearest
+# spelling to a word that isn't in it, like "nooo" or "yknow".
+# It's a symmetric-delete index: every headword, and every way of
+# deleting one letter from it, is filed under its crc32 in one
+# sorted array of (crc << 32 | word number). A query looks up the
+# word with up to two letters deleted, so that's a few dozen
+# binary searches rather than comparing against every headword,
+# and only the few candidates found get a real edit distance.
+# The index is saved next to the dictionary like the others.
+#
+class QuickTalk_SpellingIndex:
+
+  maxDistance = 2
+
+  def __init__(self,path):
+      self.path = path
+      key = dictionaryCacheKey(path,"spelling")
+      saved = readCacheFile(path,"qtspell",key)
+      if(saved is None):
+        saved = self.build()
+        writeCacheFile(path,"qtspell",key,saved)
+      (words,entries) = saved
+      self.words = words.decode("utf-8").split("\n")       #sorted
+      self.entries = array.array("Q")
+      self.entries.frombytes(entries)
+
+  def deletes(self,word):
+      return set(word[:i]+word[i+1:] for i in range(len(word)))
+
+  def hash(self,key):
+      return zlib.crc32(key.encode("utf-8"))
+
+  def build(self):
+      words = sorted(w for w in loadHeadwords(self.path) if w != "")
+      entries = []
+      for (i,word) in enumerate(words):
+        for key in self.deletes(word) | {word}:
+          entries.append((self.hash(key) << 32) | i)
+      entries.sort()
+      return ("\n".join(words).encode("utf-8"), array.array("Q",entries).tobytes())
+
+  ###
+  # Headwords filed under a key
+  #
+  def lookup(self,key):
+      h = self.hash(key) << 32
+      lo = bisect.bisect_left(self.entries,h)
+      hi = bisect.bisect_left(self.entries,h+(1 << 32))
+      return [self.words[e & 0xffffffff] for e in self.entries[lo:hi]]
+
+  ###
+  # The nearest headword to a word as (distance, headword),
+  # or None if nothing is close. Short words must be closer.
+  #
+  def nearest(self,word):
+      if(word == ""):
+        return None
+      for candidate in self.collapseRepeats(word):
+        if(self.contains(candidate)):
+          return (0,candidate)
+      limit = self.maxDistance
+      if(len(word) <= 3):
+        limit = 1
+      #Try with one letter deleted first, usually that's enough.
+      keys = {word} | self.deletes(word)
+      best = self.bestMatch(word,keys,limit)
+      if(((best is None) or (best[0] > 1)) and (limit > 1)):
+        moreKeys = set()
+        for key in keys:
+          moreKeys.update(self.deletes(key))
+        best = min(filter(None,[best,self.bestMatch(word,moreKeys-keys,limit)]),default=None)
+      if(best is None):
+        return None
+      return (best[0],best[3])
+
+  def contains(self,word):
+      i = bisect.bisect_left(self.words,word)
+      return (i < len(self.words)) and (self.words[i] == word)
+
+  ###
+  # Ways of shortening stretched-out letters, like "nooo" or
+  # "sooo goood", most likely first. A run of three or more is
+  # tried as two letters first, since that's what English doubles
+  # ("good", "see", "well"), except a vowel at the end of the word,
+  # which is more likely one ("no", "so", "hi").
+  #
+  def collapseRepeats(self,word):
+      runs = [m for m in re.finditer(r"(.)\1{2,}",word)][:4]
+      if(len(runs) == 0):
+        return
+      choices = []
+      for m in runs:
+        if((m.end() == len(word)) and (m.group(1) in "aiouy")):
+          choices.append((1,2))
+        else:
+          choices.append((2,1))
+      for lengths in itertools.product(*choices):
+        parts = []
+        last = 0
+        for (m,n) in zip(runs,lengths):
+          parts.append(word[last:m.start()]+m.group(1)*n)
+          last = m.end()
+        parts.append(word[last:])
+        yield "".join(parts)
+
+  def bestMatch(self,word,keys,limit):
+      best = None
+      for key in keys:
+        for candidate in self.lookup(key):
+          #Prefer closer, then same first letter, then similar length
+          match = (editDistance(word,candidate,limit), candidate[0] != word[0], abs(len(word)-len(candidate)), candidate)
+          if((match[0] <= limit) and ((best is None) or (match < best))):
+            best = match
+      return best
+
+  def memorySize(self):
+      return sys.getsizeof(self.words) + sum(map(len,self.words)) + sys.getsizeof("")*len(self.words) + self.entries.itemsize*len(self.entries)
+
+def loadSpellingIndex(path):
+  return getCachedDictionary(dictionaryCacheKey(path,"spelling"),QuickTalk_SpellingIndex,path)
+
+
+###
+# A trie of a dictionary's headwords, for splitting run-together
+# words like "cartoondog" into ones that are in the dictionary.
+# Nodes are just numbers: the edges are a sorted array of
+# (node << 21 | character) keys with their child nodes in another
+# array, found by binary search, and a bytearray marks where words
+# end. That's much smaller than a dict per node, and the arrays are
+# saved next to the dictionary so loading it is just reading them.
+#
+class QuickTalk_WordTrie:
+
+  def __init__(self,path):
+      key = dictionaryCacheKey(path,"trie")
+      saved = readCacheFile(path,"qttrie",key)
+      if(saved is None):
+        saved = self.build(path)
+        writeCacheFile(path,"qttrie",key,saved)
+      self.keys = array.array("Q")            # node << 21 | character, sorted
+      self.keys.frombytes(saved[0])
+      self.children = array.array("I")        # child node for each key
+      self.children.frombytes(saved[1])
+      self.terminal = bytearray(saved[2])     # node -> 1 if a word ends there
+
+  def build(self,path):
+      edges = {}
+      terminal = bytearray(1)
+      for word in loadHeadwords(path):
+        node = 0
+        for c in word:
+          key = (node << 21) | ord(c)
+          child = edges.get(key)
+          if(child is None):
+            child = len(terminal)
+            edges[key] = child
+            terminal.append(0)
+          node = child
+        terminal[node] = 1
+      keys = sorted(edges)
+      return (array.array("Q",keys).tobytes(), array.array("I",[edges[k] for k in keys]).tobytes(), bytes(terminal))
+
+  def child(self,node,c):
+      key = (node << 21) | ord(c)
+      i = bisect.bisect_left(self.keys,key)
+      if((i < len(self.keys)) and (self.keys[i] == key)):
+        return self.children[i]
+      return None
+
+  ###
+  # Every end such that word[start:end] is a dictionary word
+  #
+  def wordEnds(self,word,start):
+      ends = []
+      node = 0
+      for i in range(start,len(word)):
+        node = self.child(node,word[i])
+        if(node is None):
+          break
+        if(self.terminal[node]):
+          ends.append(i+1)
+      return ends
+
+  def memorySize(self):
+      return sys.getsizeof(self) + self.keys.itemsize*len(self.keys) + self.children.itemsize*len(self.children) + len(self.terminal)
+
+def loadWordTrie(path):
+  return getCachedDictionary(dictionaryCacheKey(path,"trie"),QuickTalk_WordTrie,path)
+
+###
+# Split a word into dictionary words, using the fewest parts and
+# then the longest ones, or None if it can't be done. Parts must
+# be two letters or more, or anything would split into "a"s and
+# "i"s. This is dynamic programming over the positions in the
+# word, walking the tries from each, so O(length squared).
+#
+def segmentWord(word,tries,minLength=2):
+  best = [None]*(len(word)+1)     # end -> (parts, -sum of squared lengths, start)
+  best[0] = (0,0,0)
+  for start in range(len(word)):
+    if(best[start] is None):
+      continue
+    for trie in tries:
+      for end in trie.wordEnds(word,start):
+        if(end-start < minLength):
+          continue
+        option = (best[start][0]+1, best[start][1]-(end-start)**2, start)
+        if((best[end] is None) or (option < best[end])):
+          best[end] = option
+  if((best[-1] is None) or (best[-1][0] < 2)):
+    return None
+  parts = []
+  end = len(word)
+  while end > 0:
+    start = best[end][2]
+    parts.insert(0,word[start:end])
+    end = start
+  return parts
+
+
+###
+# Rule-based letter-to-sound, to guess the phonemes of words that
+# aren't in any dictionary, like the characters' names, so one odd
+# word doesn't stop a long plot. The rules are crude but usually
+# give a plausible mouth shape for each syllable. Guesses are kept
+# in a small cache file so each word is only worked out once.
+#
+class QuickTalk_LetterToSound:
+
+  version = 1
+
+  #Letter groups and their phonemes, longest groups tried first.
+  rules = {
+    "ough":"AO", "augh":"AO", "eigh":"EY",
+    "tch":"CH", "sch":"S K", "igh":"AY",
+    "ch":"CH", "sh":"SH", "th":"TH", "ph":"F", "wh":"W", "ck":"K",
+    "ng":"NG", "qu":"K W", "gh":"", "kn":"N", "wr":"R",
+    "ee":"IY", "ea":"IY", "ie":"IY", "ey":"IY", "oo":"UW", "ou":"AW",
+    "ow":"OW", "oi":"OY", "oy":"OY", "ai":"EY", "ay":"EY", "au":"AO",
+    "aw":"AO", "ew":"UW", "ar":"AA R", "er":"ER", "ir":"ER", "ur":"ER",
+    "or":"AO R",
+    "a":"AE", "b":"B", "c":"K", "d":"D", "e":"EH", "f":"F", "g":"G",
+    "h":"HH", "i":"IH", "j":"JH", "k":"K", "l":"L", "m":"M", "n":"N",
+    "o":"AA", "p":"P", "q":"K", "r":"R", "s":"S", "t":"T", "u":"AH",
+    "v":"V", "w":"W", "x":"K S", "y":"IY", "z":"Z",
+  }
+  digits = ["zero","one","two","three","four","five","six","seven","eight","nine"]
+
+  def __init__(self):
+      self.memo = None      # word -> phoneme codes, loaded when first needed
+      self.changed = False
+
+  def cacheFile(self):
+      folder = tempfile.gettempdir()
+      if(IN_BLENDER):
+        folder = bpy.utils.user_resource('CONFIG')
+      return (os.path.join(folder,"quicktalk-letter-to-sound"), "qtcache",
+              (DICTIONARY_CACHE_VERSION,"letter-to-sound",self.version))
+
+  ###
+  # Phoneme codes for a word, worked out or remembered
+  #
+  def phonemes(self,word):
+      if(self.memo is None):
+        (path,suffix,key) = self.cacheFile()
+        self.memo = readCacheFile(path,suffix,key) or {}
+      if word not in self.memo:
+        self.memo[word] = self.guess(word)
+        self.changed = True
+      return self.memo[word]
+
+  def guess(self,word):
+      letters = "".join(self.digits[int(c)] if c in string.digits else c for c in word.lower())
+      phonemes = []
+      i = 0
+      while i < len(letters):
+        c = letters[i]
+        if((i > 0) and (c == letters[i-1]) and (c not in "aeiou")):
+          i = i+1          #Double consonants are one sound
+          continue
+        nextc = letters[i+1:i+2]
+        if((c == "c") and (nextc in ("e","i","y"))):
+          phonemes.append("S")
+        elif((c == "g") and (nextc in ("e","i","y"))):
+          phonemes.append("JH")
+        elif((c == "y") and (i == 0)):
+          phonemes.append("Y")
+        elif((c == "o") and (i == len(letters)-1)):
+          phonemes.append("OW")
+        elif((c == "e") and (i == len(letters)-1) and (len(letters) > 3)):
+          pass             #Silent e on the end
+        else:
+          for n in (4,3,2,1):
+            group = letters[i:i+n]
+            if((len(group) == n) and (group in self.rules)):
+              phonemes.extend(self.rules[group].split())
+              i = i+n-1
+              break
+        i = i+1
+      return bytes(PHONEME_CODES[p] for p in phonemes)
+
+  def save(self):
+      if(self.changed):
+        (path,suffix,key) = self.cacheFile()
+        writeCacheFile(path,suffix,key,self.memo)
+        self.changed = False
+
+letterToSound = QuickTalk_LetterToSound()
+
+
+###
+# Every word any script says, interned to a small number so the
+# script model can hold flat arrays of ids instead of lists of
+# strings. Scripts only ever add to it.
+#
+scriptWords = []            # id -> word
+scriptWordIds = {}          # word -> id
+
+def scriptWordId(w):
+  id = scriptWordIds.get(w)
+  if(id is None):
+    id = len(scriptWords)
+    scriptWords.append(w)
+    scriptWordIds[w] = id
+  return id
+
+###
+# One line of a dialogue: a view onto a slice of the dialogue's
+# word ids.
+#
+class QuickTalk_Line:
+  __slots__ = ("dialogue","index","start","end")
+
+  def __init__(self,dialogue,index):
+    self.dialogue = dialogue
+    self.index = index
+    self.start = dialogue.lineStarts[index]
+    self.end = dialogue.lineStarts[index+1]
+
+  def __len__(self):
+    return self.end - self.start
+
+  def __iter__(self):
+    return iter(self.words)
+
+  @property
+  def ids(self):
+    return self.dialogue.words[self.start:self.end]
+
+  @property
+  def words(self):
+    return [scriptWords[i] for i in self.ids]
+
+###
+# One voice's block of dialogue. All its words are in one array of
+# interned ids, with the prefix sums of the line lengths in another,
+# so a line's words, or a word's position in the dialogue, is just
+# index arithmetic. offset and lineOffset are the number of words
+# and lines in the script before this dialogue starts, which is
+# what maps a word or line straight onto its marker.
+#
+class QuickTalk_Dialogue:
+  __slots__ = ("voice","words","lineStarts","offset","lineOffset")
+
+  def __init__(self,voice,offset=0,lineOffset=0):
+    self.voice = voice
+    self.words = array.array('I')
+    self.lineStarts = array.array('I',[0])
+    self.offset = offset
+    self.lineOffset = lineOffset
+
+  def addLine(self,words):
+    self.words.extend(scriptWordId(w) for w in words)
+    self.lineStarts.append(len(self.words))
+
+  ###
+  # The same dialogue at another place in the script. Shares the
+  # word arrays, which are never changed once it's parsed.
+  #
+  def moved(self,offset,lineOffset):
+    d = QuickTalk_Dialogue(self.voice,offset,lineOffset)
+    d.words = self.words
+    d.lineStarts = self.lineStarts
+    return d
+
+  @property
+  def totalwords(self):
+    return len(self.words)
+
+  @property
+  def lineCount(self):
+    return len(self.lineStarts) - 1
+
+  def line(self,n):
+    return QuickTalk_Line(self,n)
+
+  @property
+  def lines(self):
+    return [QuickTalk_Line(self,n) for n in range(self.lineCount)]
+
+###
+# Split script lines into (voice, lines) blocks, one for each time
+# the voice changes, plus one at the start for any lines before
+# the first voice.
+#
+def scriptBlocks(lines):
+  voice = "narator"
+  body = []
+  for l in lines:
+    match = re.search("^([A-Za-z]*):",l)
+    if(match):
+      yield (voice, body)
+      voice = match.group(1).lower()
+      body = []
+    else:
+      body.append(l)
+  yield (voice, body)
+
+###
+# Parse a block's lines into a dialogue
+#
+def parseDialogue(voice,lines,offset=0,lineOffset=0):
+  dialogue = QuickTalk_Dialogue(voice,offset,lineOffset)
+  for l in lines:
+    words = l.split()
+    if(len(words)>0):
+      dialogue.addLine([re.sub(r'[\W_]+', '', w).lower() for w in words])     #Remove non alphanumerics
+  return dialogue
+
+###
+# Parse script lines into dialogues, yielding each one as soon as
+# its voice stops talking, so a script can be worked through while
+# it's still being read. Any voice that's switched to is noted in
+# voices, if given, whether it says anything or not.
+#
+def scriptDialogues(lines,voices=None):
+  offset = 0
+  lineOffset = 0
+  for (n,(voice,body)) in enumerate(scriptBlocks(lines)):
+    if((n > 0) and (voices is not None)):
+      voices[voice] = True
+    dialogue = parseDialogue(voice,body,offset,lineOffset)
+    if(dialogue.lineCount>0):
+      yield dialogue
+      offset = offset + dialogue.totalwords
+      lineOffset = lineOffset + dialogue.lineCount
+
+###
+# Parsed scripts, shared by all the operators so guessing markers,
+# adjusting them and plotting doesn't re-read and re-parse the
+# script every time. Files are keyed by path and only reused while
+# their size and mtime haven't changed. Text datablocks are keyed by
+# name and reused while their text is the same; Blender doesn't
+# give them an edit counter to check instead. The parsed voices and
+# dialogues are treated as read-only once they're in here.
+#
+scriptCache = collections.OrderedDict()     # key -> (version, (voices, dialogues))
+SCRIPT_CACHE_SIZE = 8
+
+###
+# The dialogue blocks last parsed from each Text datablock, by the
+# block's voice and lines, so an edit only re-parses the blocks it
+# touched.
+#
+textBlockCache = {}         # key -> {(voice, lines): dialogue}
+
+def cacheScript(key,version,parsed):
+  scriptCache[key] = (version, parsed)
+  scriptCache.move_to_end(key)
+  while len(scriptCache) > SCRIPT_CACHE_SIZE:
+    (old,value) = scriptCache.popitem(last=False)
+    textBlockCache.pop(old,None)
+
+###
+# Parse a Text datablock, reusing whatever blocks of it haven't
+# changed since it was last parsed.
+#
+def parseScriptText(text):
+  key = ("text", text.name_full)
+  source = text.as_string()
+  if((key in scriptCache) and (scriptCache[key][0] == source)):
+    scriptCache.move_to_end(key)
+    return scriptCache[key][1]
+
+  oldBlocks = textBlockCache.get(key,{})
+  blocks = {}
+  voices = {}
+  dialogues = []
+  offset = 0
+  lineOffset = 0
+  for (n,(voice,body)) in enumerate(scriptBlocks(source.split("\n"))):
+    if(n > 0):
+      voices[voice] = True
+    block = (voice, tuple(body))
+    dialogue = blocks.get(block) or oldBlocks.get(block)
+    if(dialogue is None):
+      dialogue = parseDialogue(voice,body)
+    blocks[block] = dialogue
+    if(dialogue.lineCount>0):
+      dialogues.append(dialogue.moved(offset,lineOffset))
+      offset = offset + dialogue.totalwords
+      lineOffset = lineOffset + dialogue.lineCount
+
+  textBlockCache[key] = blocks
+  cacheScript(key,source,(voices,dialogues))
+  return (voices,dialogues)
+
+###
+# Where a scene's script comes from: its Text datablock if it's
+# got one, otherwise the script file.
+#
+def getScriptSource(scene):
+  if(scene.quicktalk_script_text is not None):
+    return scene.quicktalk_script_text
+  return scene.quicktalk_script_file
+
+###
+# Scripts bigger than this are never held in memory whole when
+# they're opened for streaming, they're parsed a dialogue at a time
+# every time they're worked through instead. Plotting looks their
+# words up a batch of dialogues at a time.
+#
+SCRIPT_STREAM_BYTES = 8*1024*1024
+STREAM_BATCH_WORDS = 20000
+
+###
+# Add (name, frame) markers straight to a scene's timeline. No
+# operators, no changing frame and no need for a timeline area, so
+# thousands go in at once and it works in background mode too.
+# Like the marker.add operator it won't put a second marker on a
+# frame that already has one. Returns how many were added.
+#
+def addMarkers(scene,markers):
+  timeline = scene.timeline_markers
+  taken = set(m.frame for m in timeline)
+  added = 0
+  for (name,frame) in markers:
+    frame = int(frame)
+    if(frame in taken):
+      continue
+    timeline.new(name,frame=frame)
+    taken.add(frame)
+    added = added + 1
+  return added
+
+###
+# QuickTalk's markers in a scene, sorted once into frame arrays for
+# each kind (!D dialogue, !L line and !W word) so the operators
+# don't each scan and sort the whole timeline. An index is kept per
+# scene and only rebuilt when the markers' fingerprint, their count
+# and a hash of their names and frames, says they've changed.
+#
+MARKER_KINDS = ("!D","!L","!W")
+markerIndexes = {}          # scene name -> index
+
+def markerFingerprint(scene):
+  timeline = scene.timeline_markers
+  return (len(timeline), hash(tuple((m.name, m.frame) for m in timeline)))
+
+class QuickTalk_MarkerIndex:
+
+  def __init__(self,scene,fingerprint):
+      self.fingerprint = fingerprint
+      frames = dict((kind,[]) for kind in MARKER_KINDS)
+      for m in scene.timeline_markers:
+        kind = m.name[-2:]
+        if(kind in frames):
+          frames[kind].append(m.frame)
+      self.frames = dict((kind,array.array('i',sorted(frames[kind]))) for kind in MARKER_KINDS)
+      self.merged = {}
+
+  ###
+  # Sorted frames of all the markers of these kinds, plus a fake one
+  # at the given end frame.
+  #
+  def starts(self,kinds,end):
+      if(kinds not in self.merged):
+        self.merged[kinds] = list(heapq.merge(*[self.frames[k] for k in kinds]))
+      starts = list(self.merged[kinds])
+      bisect.insort(starts,end)
+      return starts
+
+def getMarkerIndex(scene):
+  fingerprint = markerFingerprint(scene)
+  index = markerIndexes.get(scene.name_full)
+  if((index is None) or (index.fingerprint != fingerprint)):
+    index = QuickTalk_MarkerIndex(scene,fingerprint)
+    markerIndexes[scene.name_full] = index
+  return index
+
+###
+# Collects the keys a plot makes for an armature's bones and writes
+# them to each bone's F-curve in one go, instead of a keyframe_insert
+# round trip per key. A later key on the same frame replaces an
+# earlier one, and keys already on the curves are kept unless
+# they're on a frame we're writing, just like keyframe_insert. New
+# keys get the interpolation and handle types of a key Blender made
+# with keyframe_insert, so they follow the user's preferences. Only
+# the x component (index 0) of the property is keyed.
+#
+class QuickTalk_KeyframeWriter:
+
+  def __init__(self,obj,prop):
+      self.obj = obj
+      self.prop = prop            # "rotation_euler" or "location"
+      self.points = {}            # bone name -> {frame: value}
+
+  def add(self,bone,frame,value):
+      if bone not in self.points:
+        self.points[bone] = {}
+      self.points[bone][frame] = value
+
+  def addKeys(self,bone,frames,values):
+      if bone not in self.points:
+        self.points[bone] = {}
+      self.points[bone].update(zip(frames,values))
+
+  ###
+  # Find the bone's curve, making it with keyframe_insert for the
+  # first key if it isn't there yet so it gets the action, group
+  # and default keyframe settings Blender would normally give it.
+  #
+  def findCurve(self,bone,keys):
+      path = 'pose.bones["%s"].%s' % (bone,self.prop)
+      data = self.obj.animation_data
+      if((data is not None) and (data.action is not None)):
+        fcurve = data.action.fcurves.find(path,index=0)
+        if(fcurve is not None):
+          return fcurve
+      (frame,value) = keys.popitem()
+      poseBone = self.obj.pose.bones[bone]
+      setattr(poseBone,self.prop,(value,0,0))
+      poseBone.keyframe_insert(self.prop,index=0,frame=frame,group="QuickTalk")        #0=x, 1=y, 2=z
+      return self.obj.animation_data.action.fcurves.find(path,index=0)
+
+  ###
+  # Give the points from count on the interpolation and handle
+  # types of the one before them. keyframe_points.add() makes them
+  # Bezier with auto-clamped handles, Blender's defaults, so
+  # there's only anything to do if the user's changed those, and
+  # then it's one foreach_get/set per setting for the whole curve.
+  #
+  def copyKeySettings(self,points,count):
+      template = points[count-1]
+      if((template.interpolation == 'BEZIER') and (template.handle_left_type == 'AUTO_CLAMPED') and (template.handle_right_type == 'AUTO_CLAMPED')):
+        return
+      for setting in ('interpolation','handle_left_type','handle_right_type'):
+        values = array.array('i',bytes(4*len(points)))
+        points.foreach_get(setting,values)
+        values[count:] = array.array('i',[values[count-1]])*(len(points)-count)
+        points.foreach_set(setting,values)
+
+  ###
+  # Write everything we've collected
+  #
+  def write(self):
+      for (bone,keys) in self.points.items():
+        keys = dict(keys)
+        fcurve = self.findCurve(bone,keys)
+        points = fcurve.keyframe_points
+        co = array.array('f',bytes(8*len(points)))
+        points.foreach_get('co',co)
+        existing = dict((co[i],i) for i in range(0,len(co),2))
+        for frame in list(keys):
+          if frame in existing:
+            co[existing[frame]+1] = keys.pop(frame)
+        count = len(points)
+        points.add(len(keys))
+        for (frame,value) in keys.items():
+          co.append(frame)
+          co.append(value)
+        points.foreach_set('co',co)
+        if(count > 0):
+          self.copyKeySettings(points,count)
+        fcurve.update()
+      self.points = {}
+
+###
+# A plot plan is every key a plot makes for the bones, in the order
+# plotting one word at a time would make them: the viseme code of
+# the bone, the frame and the value. Compiling one needs NumPy but
+# not Blender, so it can be tested and benchmarked on its own.
+#
+PLOT_PLAN_DTYPE = [("channel","u1"),("frame","i4"),("value","f4")]
+
+###
+# Compile the plan for a list of (visemes, startFrame, endFrame)
+# words, doing the same sums as plotWordToTimeline and plotPhoneme
+# but for all the words at once. Every word needs some visemes.
+#
+def compilePlotPlan(words):
+  if(len(words) == 0):
+    return numpy.empty(0,dtype=PLOT_PLAN_DTYPE)
+  counts = numpy.array([len(w[0]) for w in words],dtype=numpy.int64)
+  starts = numpy.array([w[1] for w in words],dtype=numpy.int64)
+  lengths = numpy.array([w[2] for w in words],dtype=numpy.int64) - starts
+  #Obviously a word has a gap after it if it's this long, fix the length lower
+  lengths = numpy.where(lengths > counts*5, counts*4, lengths)
+  steps = lengths / counts
+
+  #One row per word, one column per viseme. Accumulating along the
+  #rows adds up each word's steps in the same order as the loop
+  #would, so every frame comes out exactly the same.
+  used = numpy.arange(counts.max()) < counts[:,None]
+  grid = numpy.repeat(steps[:,None],used.shape[1],axis=1)
+  grid[:,0] = starts - steps/2
+  current = numpy.add.accumulate(grid,axis=1)[used]
+  codes = numpy.full(used.shape,-1,dtype=numpy.int16)
+  codes[used] = numpy.frombuffer(b"".join(w[0] for w in words),dtype=numpy.uint8)
+  last = numpy.full(used.shape,-1,dtype=numpy.int16)
+  last[:,1:] = codes[:,:-1]
+
+  #Each viseme goes down (unless it was the last one too), up, then down
+  step = numpy.repeat(steps,counts)
+  up = current + step
+  frames = numpy.stack([current, up, up + step],axis=1)
+  keep = numpy.stack([(codes != last)[used], numpy.ones(len(step),bool), numpy.ones(len(step),bool)],axis=1)
+  plan = numpy.empty(int(keep.sum()),dtype=PLOT_PLAN_DTYPE)
+  plan["channel"] = numpy.repeat(codes[used],3)[keep.ravel()]
+  plan["frame"] = frames.ravel()[keep.ravel()]
+  plan["value"] = numpy.tile(numpy.array([0,1.571,0],dtype=numpy.float32),len(step))[keep.ravel()]
+  return plan
+
+###
+# Give a plan's keys to a keyframe writer, for whichever of the
+# bones it's got. The last key on a frame wins, as it would if they
+# were keyed in order.
+#
+def writePlotPlan(plan,writer,bones):
+  channels = {}     # bone name -> viseme codes plotted to it
+  for code in numpy.unique(plan["channel"]).tolist():
+    name = VISEMES[code]
+    if((name=="MBP") and (not "MBP" in bones)):
+      name="M"
+    if name in bones:
+      channels.setdefault(name,[]).append(code)
+    else:
+      print("Can't find bone to plot "+name+" ("+str(int(numpy.count_nonzero(plan["channel"] == code)))+" keys)")
+  for (name,codes) in channels.items():
+    keys = plan[numpy.isin(plan["channel"],codes)][::-1]
+    (frames,first) = numpy.unique(keys["frame"],return_index=True)
+    writer.addKeys(name,frames.tolist(),keys["value"][first].tolist())
+
+###
+# Which keys of a plot to keep when simplifying it, for keys given
+# as arrays of channel, frame and value, sorted by frame within each
+# channel. Of keys on the same frame only the last is kept, and a
+# key whose value is within tolerance of both its neighbours' is
+# dropped, as it's on a flat stretch the curve would make anyway.
+# The first and last keys of each channel are always kept.
+#
+def reduceKeys(channels,frames,values,tolerance):
+  keep = numpy.ones(len(frames),dtype=bool)
+  same = channels[1:] == channels[:-1]
+  keep[:-1] = ~(same & (numpy.abs(frames[1:] - frames[:-1]) < 0.001))
+
+  kept = numpy.flatnonzero(keep)
+  c = channels[kept]
+  v = values[kept]
+  flat = ((c[1:-1] == c[:-2]) & (c[1:-1] == c[2:]) &
+          (numpy.abs(v[1:-1] - v[:-2]) <= tolerance) & (numpy.abs(v[1:-1] - v[2:]) <= tolerance))
+  keep[kept[1:-1][flat]] = False
+  return keep
+
+###
+# Everything about a key that simplifying has to keep for the ones
+# it leaves, as (name, values per key, NumPy type). The types come
+# before the handles so setting them doesn't move the handles.
+#
+KEYFRAME_SETTINGS = (("interpolation",1,"i4"),("easing",1,"i4"),("type",1,"i4"),
+                     ("handle_left_type",1,"i4"),("handle_right_type",1,"i4"),
+                     ("back",1,"f4"),("amplitude",1,"f4"),("period",1,"f4"),
+                     ("co",2,"f4"),("handle_left",2,"f4"),("handle_right",2,"f4"))
+
+###
+# Simplify the QuickTalk group's curves on these objects, all in
+# one go. Returns how many keys they had before and after.
+#
+def reduceKeyframes(objects,tolerance):
+  curves = []
+  for obj in objects:
+    if((obj.animation_data is None) or (obj.animation_data.action is None)):
+      continue
+    for fcurve in obj.animation_data.action.fcurves:
+      if((fcurve.group is not None) and (fcurve.group.name == "QuickTalk")):
+        curves.append(fcurve)
+  counts = numpy.array([len(fcurve.keyframe_points) for fcurve in curves],dtype=numpy.int64)
+  total = int(counts.sum())
+  if(total == 0):
+    return (0,0)
+
+  co = numpy.empty(total*2,dtype=numpy.float32)
+  ends = numpy.cumsum(counts)
+  for (fcurve,start,end) in zip(curves,ends-counts,ends):
+    fcurve.keyframe_points.foreach_get('co',co[start*2:end*2])
+  co = co.reshape(-1,2)
+  keep = reduceKeys(numpy.repeat(numpy.arange(len(curves)),counts),co[:,0],co[:,1],tolerance)
+
+  #Rebuild each curve that loses keys once, with everything about
+  #the keys it keeps read and written back in bulk.
+  for (fcurve,start,end) in zip(curves,ends-counts,ends):
+    kept = keep[start:end]
+    if(kept.all()):
+      continue
+    points = fcurve.keyframe_points
+    settings = []
+    for (name,size,dtype) in KEYFRAME_SETTINGS:
+      values = numpy.empty(len(points)*size,dtype=dtype)
+      points.foreach_get(name,values)
+      settings.append((name,values.reshape(-1,size)[kept].ravel()))
+    points.clear()
+    points.add(int(kept.sum()))
+    for (name,values) in settings:
+      points.foreach_set(name,values)
+    fcurve.update()
+  return (total,int(keep.sum()))
+
+###
+# The armatures a scene's voice registry says each voice is
+# plotted to, by voice
+#
+def getVoiceRegistry(scene):
+  registry = {}
+  for entry in scene.quicktalk_voices:
+    voice = entry.voice.strip().lower()
+    if((voice != "") and (entry.armature is not None)):
+      registry[voice] = entry.armature
+  return registry
+
+###
+# The armature for each voice: the one the scene's voice registry
+# says, or if it isn't in there, the one findVoiceArmatures finds
+# out of those the registry hasn't given to another voice.
+#
+def getVoiceTargets(scene,voices):
+  registry = getVoiceRegistry(scene)
+  taken = set(obj.name for obj in registry.values())
+  targets = findVoiceArmatures(scene,[v for v in voices if v not in registry],taken)
+  for voice in voices:
+    if voice in registry:
+      targets[voice] = registry[voice]
+  return targets
+
+###
+# Find an armature for each voice: the first, by name, whose name
+# starts with the voice's name, the same rule plotting to the
+# selected object uses. Armatures named in exclude are skipped.
+#
+def findVoiceArmatures(scene,voices,exclude=()):
+  armatures = sorted((obj for obj in scene.objects if((obj.type == 'ARMATURE') and (obj.name not in exclude))),key=lambda obj: obj.name)
+  found = {}
+  for voice in voices:
+    for obj in armatures:
+      if(obj.name.lower()[0:len(voice)] == voice):
+        found[voice] = obj
+        break
+  return found
+
 ###
 # Class for script-manipulating functions
 #
 class QuickTalk_Script:
 
-  phoneme_dictionary = {}
+  ###
+  # Load the script at init, from a file or a Text datablock. If
+  # we're streaming and it's a big file, leave it on disk and parse
+  # it as it's worked through.
+  #
+  def __init__(self,source,stream=False):
+      self.phoneme_dictionary = QuickTalk_PhonemeTable()
+      self.mainDictionary = self.phoneme_dictionary
+      self.profile = "standard"
+      self.dictionaryFiles = []
+      self.fetchMainWords = None
+      self.missingWords = {}      # word -> (visemes, how we got them)
+      self.writers = {}           # object name -> QuickTalk_KeyframeWriter while plotting
+      self.keyframes = None       # the one for the object we're plotting to
+      self.target = None
+      self.keyReduction = None    # (keys before, keys after) if the plot was simplified
+      self.voices = {}
+      self.dialogues = None       # None when streaming
+      if(not isinstance(source,str)):
+        self.path = None
+        (self.voices, self.dialogues) = parseScriptText(source)
+        return
+      self.path = os.path.abspath(bpy.path.abspath(source))
+      if((not stream) or (os.path.getsize(self.path) <= SCRIPT_STREAM_BYTES)):
+        self.load(self.path)
 
   ###
-  # Load the script at init
+  # Get the parsed script from the cache, or read and parse it
   #
-  def __init__(self,filename):
-      file = open(bpy.path.abspath(filename),"r")
-      self.lines = file.readlines()
-      file.close()
+  def load(self,path):
+      st = os.stat(path)
+      version = (st.st_size, st.st_mtime_ns)
+      if((path in scriptCache) and (scriptCache[path][0] == version)):
+        scriptCache.move_to_end(path)
+        (self.voices, self.dialogues) = scriptCache[path][1]
+        return
+
+      with open(path,"r") as file:
+        self.parse(file)
+      self.dumpScript()
+      cacheScript(path,version,(self.voices, self.dialogues))
 
-      #Parse it
-      self.parsed = "okay"
+  ###
+  # Parse the script's lines into voices and dialogues
+  #
+  def parse(self,lines):
       self.voices = {}
-      self.dialogues = []
-      currentVoice = "narator"
-      currentDialogue = {}
-      currentDialogue['voice'] = currentVoice;
-      currentDialogue['lines'] = []
-      currentDialogue['totalwords'] = 0
-      numWords=0
-      for l in self.lines:
-        match = re.search("^([A-Za-z]*):",l)
-        if(match):
-          #Change voice
-          currentVoice = match.group(1).lower()
-          self.voices[currentVoice] = True
-          if(len(currentDialogue['lines'])>0):
-            self.dialogues.append(currentDialogue)
-          currentDialogue = {}
-          currentDialogue['voice'] = currentVoice;
-          currentDialogue['lines'] = []
-          currentDialogue['totalwords'] = 0
-          numWords=0
-        else:
-          #Dialogue line
-          words = l.split()
-          currentLine = []
-          if(len(words)>0):
-            for w in words:
-              w = re.sub('[\W_]+', '', w).lower()     #Remove non alphanumerics
-              currentLine.append(w)
-              currentDialogue['totalwords'] = currentDialogue['totalwords'] + 1
-            currentDialogue['lines'].append(currentLine)
-
-      if(len(currentDialogue['lines'])>0):
-        self.dialogues.append(currentDialogue)
-      self.dumpScript()
+      self.dialogues = list(scriptDialogues(lines,self.voices))
+
+  ###
+  # The script's dialogues in order, parsed from the file as we go
+  # if we're streaming it.
+  #
+  def streamDialogues(self):
+      if(self.dialogues is not None):
+        yield from self.dialogues
+        return
+      with open(self.path,"r") as file:
+        yield from scriptDialogues(file,self.voices)
+
+  ###
+  # Dialogues in batches of about STREAM_BATCH_WORDS words
+  #
+  def dialogueBatches(self):
+      batch = []
+      count = 0
+      for d in self.streamDialogues():
+        batch.append(d)
+        count = count + d.totalwords
+        if(count >= STREAM_BATCH_WORDS):
+          yield batch
+          batch = []
+          count = 0
+      if(len(batch) > 0):
+        yield batch
+
   ###
   # Get total number of words in this script
   # 
   def getTotalWords(self):
-      total = 0
-      for d in self.dialogues:
-        total = total + d['totalwords']
-      return total
+      last = None
+      if(self.dialogues is not None):
+        last = self.dialogues[-1] if len(self.dialogues) > 0 else None
+      else:
+        for last in self.streamDialogues():
+          pass
+      if(last is None):
+        return 0
+      return last.offset + last.totalwords
+
+  ###
+  # Get the set of distinct words spoken in this script
+  #
+  def getWordSet(self):
+      ids = set()
+      for d in self.streamDialogues():
+        ids.update(d.words)
+      return set(scriptWords[i] for i in ids)
 
   ###
   # Add the dialogue markers
   #
   def addDialogueMarkers(self):
+      addMarkers(bpy.context.scene,self.dialogueMarkers())
+
+  ###
+  # Where the dialogue markers go, spread over the scene in
+  # proportion to how many words each dialogue has.
+  #
+  def dialogueMarkers(self):
       numFrames = bpy.context.scene.frame_end - bpy.context.scene.frame_start + 1
       numWords = self.getTotalWords()
       framesPerWord = numFrames/numWords
 
-      #Switch to a timeline
-      default_frame = bpy.context.scene.frame_current
-      default_area = bpy.context.area.type
-      bpy.context.area.type = ('GRAPH_EDITOR')      #TIMELINE
-
-      #Add some markers
       frame = bpy.context.scene.frame_start
-      for d in self.dialogues:
-        bpy.context.scene.frame_current = frame
-        marker = bpy.ops.marker.add()
-        bpy.ops.marker.rename(name=d['voice']+"!D")
-        frame = frame + framesPerWord*d['totalwords']
-
-      bpy.context.scene.frame_current = default_frame
-      bpy.context.area.type = default_area
-
+      for d in self.streamDialogues():
+        yield (d.voice+"!D", frame)
+        frame = frame + framesPerWord*d.totalwords
 
   ###
   # Add the line markers
@@ -453,290 +2513,108 @@ class QuickTalk_Script:
   # we can't add in the first line from each dialogue.
   #
   def addLineMarkers(self):
-      #Switch to a timeline
-      default_frame = bpy.context.scene.frame_current
-      default_area = bpy.context.area.type
-      bpy.context.area.type = ('GRAPH_EDITOR')
+      #Find the dialogue markers, with a fake one at the end of the scene
+      dialogueStarts = getMarkerIndex(bpy.context.scene).starts(("!D",),bpy.context.scene.frame_end)
 
-      #Find the dialogue markers
-      dialogueStarts = []
-      for m in bpy.context.scene.timeline_markers:
-        if(m.name[-2:]=="!D"):
-          frame = m.frame
-          dialogueStarts.append(frame)
-      dialogueStarts.append(bpy.context.scene.frame_end)  #Fake one at the end of the scene
-      dialogueStarts = sorted(dialogueStarts)
-
-      #Add line markers for each dialogue
-      n=0;
-      for d in self.dialogues:
-        frame = dialogueStarts[n];
+      addMarkers(bpy.context.scene,self.lineMarkers(dialogueStarts))
+
+  ###
+  # Where the line markers go, between the dialogue markers
+  #
+  def lineMarkers(self,dialogueStarts):
+      for (n,d) in enumerate(self.streamDialogues()):
         start = dialogueStarts[n]
-        n+=1
-        end = dialogueStarts[n]
-        framesPerWord = (end-start) / d['totalwords']
-
-        ln = 0
-        for l in d['lines']:
-            ln=ln+1
-            if(ln>1):
-              bpy.context.scene.frame_current = frame
-              marker = bpy.ops.marker.add()
-              name=l[0][0:10]+"!L"
-              bpy.ops.marker.rename(name=name)
-            frame = frame + framesPerWord*len(l)
-           
-     
+        end = dialogueStarts[n+1]
+        framesPerWord = (end-start) / d.totalwords
 
-      bpy.context.scene.frame_current = default_frame
-      bpy.context.area.type = default_area
+        for ln in range(1,d.lineCount):
+          first = d.lineStarts[ln]
+          yield (scriptWords[d.words[first]][0:10]+"!L", start + framesPerWord*first)
 
-    
   ###
   # Add the word markers
   # Note: We can only have one marker per frame, so
   # we can't add in the first word from each line.
   #
   def addWordMarkers(self):
-      #Switch to a timeline
-      default_frame = bpy.context.scene.frame_current
-      default_area = bpy.context.area.type
-      bpy.context.area.type = ('GRAPH_EDITOR')
+      #Find the existing markers, with a fake one at the end of the scene
+      lineStarts = getMarkerIndex(bpy.context.scene).starts(("!D","!L"),bpy.context.scene.frame_end)
 
-      #Find the existing markers
-      lineStarts = []
-      for m in bpy.context.scene.timeline_markers:
-        if((m.name[-2:]=="!D") or (m.name[-2:]=="!L")):
-          frame = m.frame
-          lineStarts.append(frame)
-      lineStarts.append(bpy.context.scene.frame_end)  #Fake one at the end of the scene
-      lineStarts = sorted(lineStarts)
-
-      #Add word markers for each line
-      n=0;
-      for d in self.dialogues:
-        for l in d['lines']:
-          frame = lineStarts[n];
-          start = lineStarts[n]
-          n+=1
-          end = lineStarts[n]
-          framesPerWord = (end-start) / len(l)
+      addMarkers(bpy.context.scene,self.wordMarkers(lineStarts))
 
-          wn = 0
-          for w in l:
-            wn=wn+1
-            if(wn>1):
-              bpy.context.scene.frame_current = frame
-              marker = bpy.ops.marker.add()
-              name=w[0:10]+"!W"
-              bpy.ops.marker.rename(name=name)
-            frame = frame + framesPerWord
+  ###
+  # Where the word markers go, between the line markers
+  #
+  def wordMarkers(self,lineStarts):
+      for d in self.streamDialogues():
+        for ln in range(d.lineCount):
+          n = d.lineOffset + ln
+          start = lineStarts[n]
+          end = lineStarts[n+1]
+          first = d.lineStarts[ln]
+          last = d.lineStarts[ln+1]
+          framesPerWord = (end-start) / (last-first)
 
-      bpy.context.scene.frame_current = default_frame
-      bpy.context.area.type = default_area
+          for wn in range(1,last-first):
+            yield (scriptWords[d.words[first+wn]][0:10]+"!W", start + framesPerWord*wn)
 
 
   ###
-  # Load Dictionary Function is mostly ripped out
-  # of the Papagayo source code
+  # Load the phoneme dictionary for the scene's dictionary file,
+  # mapped with the profile for the current bone option, with any
+  # overlay dictionaries stacked on top. Overlays are small so are
+  # always loaded whole.
+  #
   def LoadDictionary(self):
-      mappings = {
-        "AA0":"AI",
-        "AA1":"AI",
-        "AA2":"AI",
-        "AE0":"AI",
-        "AE1":"AI",
-        "AE2":"AI",
-        "AH0":"AI",
-        "AH1":"AI",
-        "AH2":"AI",
-        "AO0":"O",
-        "AO1":"O",
-        "AO2":"O",
-        "AW0":"O",
-        "AW1":"O",
-        "AW2":"O",
-        "AY0":"AI",
-        "AY1":"AI",
-        "AY2":"AI",
-        "B":"MBP",
-        "CH":"ETC",
-        "D":"ETC",
-        "DH":"ETC",
-        "EH0":"E",
-        "EH1":"E",
-        "EH2":"E",
-        "ER0":"E",
-        "ER1":"E",
-        "ER2":"E",
-        "EY0":"E",
-        "EY1":"E",
-        "EY2":"E",
-        "F":"FV",
-        "G":"ETC",
-        "HH":"ETC",
-        "IH0":"AI",
-        "IH1":"AI",
-        "IH2":"AI",
-        "IY0":"E",
-        "IY1":"E",
-        "IY2":"E",
-        "JH":"ETC",
-        "K":"ETC",
-        "L":"L",
-        "M":"MBP",
-        "N":"ETC",
-        "NG":"ETC",
-        "OW0":"O",
-        "OW1":"O",
-        "OW2":"O",
-        "OY0":"WQ",
-        "OY1":"WQ",
-        "OY2":"WQ",
-        "P":"MBP",
-        "R":"ETC",
-        "S":"ETC",
-        "SH":"ETC",
-        "T":"ETC",
-        "TH":"TH",
-        "UH0":"U",
-        "UH1":"U",
-        "UH2":"U",
-        "UW0":"U",
-        "UW1":"U",
-        "UW2":"U",
-        "V":"FV",
-        "W":"WQ",
-        "Y":"ETC",
-        "Z":"ETC",
-        "ZH":"ETC",
-        "E21":"E",
-      }
-      #Alternate mappings for MHX2 import
-      if(bpy.context.scene.quicktalk_bone_option == "2"):
-        mappings = {
-          "AA0":"AH",
-          "AA1":"AH",
-          "AA2":"AH",
-          "AE0":"AH",
-          "AE1":"AH",
-          "AE2":"AH",
-          "AH0":"AH",
-          "AH1":"AH",
-          "AH2":"AH",
-          "AO0":"O",
-          "AO1":"O",
-          "AO2":"O",
-          "AW0":"O",
-          "AW1":"O",
-          "AW2":"O",
-          "AY0":"AH",
-          "AY1":"AH",
-          "AY2":"AH",
-          "B":"MBP",
-          "CH":"Etc",
-          "D":"Etc",
-          "DH":"Etc",
-          "EH0":"EH",
-          "EH1":"EH",
-          "EH2":"EH",
-          "ER0":"EH",
-          "ER1":"EH",
-          "ER2":"EH",
-          "EY0":"EE",
-          "EY1":"EE",
-          "EY2":"EE",
-          "F":"FV",
-          "G":"G",
-          "HH":"Etc",
-          "IH0":"AH",
-          "IH1":"AH",
-          "IH2":"AH",
-          "IY0":"EE",
-          "IY1":"EE",
-          "IY2":"EE",
-          "JH":"Etc",
-          "K":"Etc",
-          "L":"L",
-          "M":"MBP",
-          "N":"Etc",
-          "NG":"Etc",
-          "OW0":"O",
-          "OW1":"O",
-          "OW2":"O",
-          "OY0":"OO",
-          "OY1":"OO",
-          "OY2":"OO",
-          "P":"MBP",
-          "R":"R",
-          "S":"S",
-          "SH":"SH",
-          "T":"Etc",
-          "TH":"TH",
-          "UH0":"OO",
-          "UH1":"OO",
-          "UH2":"OO",
-          "UW0":"OO",
-          "UW1":"OO",
-          "UW2":"OO",
-          "V":"FV",
-          "W":"OO",
-          "Y":"Etc",
-          "Z":"Etc",
-          "ZH":"Etc",
-          "E21":"EE",
-        }
-
-
-      inFile = open(bpy.path.abspath(bpy.context.scene.quicktalk_dict_file), 'r')
-
-      for line in inFile.readlines():
-        if line[0] == '#':
-          continue # skip comments in the dictionary
-        # strip out leading/trailing whitespace
-        line.strip()
-        line = line.rstrip('\r\n')
-
-        # split into components
-        entry = line.split()
-        if len(entry) == 0:
-          continue
-        # Ditch dules that have (xx) after 'en
-        if entry[0].endswith(')'):
-          continue
-        # add this entry to the in-memory dictionary
-        for i in range(len(entry)):
-          name = entry[0]
-          name = re.sub('[\W_]+', '', name).lower()     #Remove non alphanumerics
-          if i == 0:
-            self.phoneme_dictionary[name] = []
-          else:
-            rawentry = entry[i]
-            try:
-              entry[i] = entry[i]
-            except:
-              print("Unknown phoneme:", entry[i], "in word:", entry[0])
-            self.phoneme_dictionary[name].append(mappings[entry[i]])
-      inFile.close()
-      inFile = None
+      (path,profile) = getDictionarySettings(bpy.context.scene)
+      self.profile = profile
+      self.fetchMainWords = None
+      #A streamed script's words are loaded a batch at a time as it's plotted
+      words = self.getWordSet() if self.dialogues is not None else set()
+      if(bpy.context.scene.quicktalk_dict_mode == "SCRIPT"):
+        self.phoneme_dictionary = parseDictionaryWords(path,profile,words)
+        self.fetchMainWords = lambda words: parseDictionaryWords(path,profile,words)
+      elif(bpy.context.scene.quicktalk_dict_mode == "INDEX"):
+        self.phoneme_dictionary = loadIndexedDictionary(path,profile)
+      elif(bpy.context.scene.quicktalk_dict_mode == "SQLITE"):
+        database = loadSqliteDictionary(path,profile)
+        self.phoneme_dictionary = database.lookupWords(words)
+        self.fetchMainWords = database.lookupWords
+      else:
+        self.phoneme_dictionary = loadPhonemeDictionary(path,profile)
+      self.mainDictionary = self.phoneme_dictionary
+
+      overlays = getOverlayPaths(bpy.context.scene)
+      if(len(overlays) > 0):
+        layers = [self.phoneme_dictionary]
+        for overlay in overlays:
+          layers.append(loadPhonemeDictionary(overlay,profile))
+        self.phoneme_dictionary = QuickTalk_LayeredDictionary(layers)
+      self.dictionaryFiles = [path]+overlays
+
+      self.resolveMissingWords(words)
+
+  ###
+  # Make sure these words can be looked up, fetching any we haven't
+  # got yet from the main dictionary when we only load the words
+  # we need.
+  #
+  def loadWords(self,words):
+      words = [w for w in words if (w not in self.phoneme_dictionary) and (w not in self.missingWords)]
+      if((len(words) > 0) and (self.fetchMainWords is not None)):
+        self.mainDictionary.extend(self.fetchMainWords(words))
+      self.resolveMissingWords(words)
 
 
   ###
   # Plot a single dot on a timeline
   #
-  def plotDot(self,name,value,frame):
-    if((name=="MBP") and (not "MBP" in bpy.context.active_object.pose.bones)):
+  def plotDot(self,code,value,frame):
+    name = VISEMES[code]
+    if((name=="MBP") and (not "MBP" in self.target.pose.bones)):
         name="M"
-    if name in bpy.context.active_object.pose.bones:
-      bone = bpy.context.active_object.pose.bones[name]
-      if(bpy.context.scene.quicktalk_bone_option == "0"):
-        #X-Rotation
-        bone.rotation_euler = (value,0,0)
-        bone.keyframe_insert("rotation_euler",index=0,frame=frame,group="QuickTalk")        #0=x, 1=y, 2=z
-      elif(bpy.context.scene.quicktalk_bone_option == "1"):
-        #X-Translation
-        bone.location = (value,0,0)
-        bone.keyframe_insert("location",index=0,frame=frame,group="QuickTalk")        #0=x, 1=y, 2=z
+    if name in self.target.pose.bones:
+      self.keyframes.add(name,frame,value)
     else:
         print("Can't find bone to plot "+name+" at "+str(value)+" to "+str(frame))
 
@@ -749,7 +2627,7 @@ class QuickTalk_Script:
       bpy.context.scene.frame_current = start;
       t = bpy.context.scene.tool_settings.use_keyframe_insert_auto;
       bpy.context.scene.tool_settings.use_keyframe_insert_auto=True;
-      bpy.ops.mhx2.set_viseme(viseme=p);
+      bpy.ops.mhx2.set_viseme(viseme=VISEMES[p]);
       bpy.context.scene.tool_settings.use_keyframe_insert_auto=t;
       return;
     else:
@@ -760,62 +2638,235 @@ class QuickTalk_Script:
       self.plotDot(p,1.571,int(start+step))
       self.plotDot(p,0,int(start+step+step))
 
+  ###
+  # Get the visemes for a word. Words that aren't in the
+  # dictionary are resolved once and remembered, so the operator
+  # can say which they were.
+  #
+  def lookupWord(self,w):
+      w = w.lower()
+      if(w == ""):
+        return b""      #Just punctuation, like "-" or "..."
+      phonemes = self.phoneme_dictionary.get(w)
+      if(phonemes is None):
+        if w not in self.missingWords:
+          self.resolveMissingWords([w])
+        phonemes = self.missingWords[w][0]
+      return phonemes
+
+  ###
+  # Work out pronunciations for whichever of these words aren't
+  # in the dictionary: join up the words it's made of if it's a
+  # compound, use the nearest spelling that is in it if one's close
+  # enough, or else guess from the letters.
+  #
+  def resolveMissingWords(self,words):
+      missing = sorted(w for w in words if (w != "") and (w not in self.phoneme_dictionary) and (w not in self.missingWords))
+      if(len(missing) == 0):
+        return
+
+      splits = {}
+      tries = [loadWordTrie(f) for f in self.dictionaryFiles]
+      for w in missing:
+        parts = segmentWord(w,tries)
+        if(parts is not None):
+          splits[w] = parts
+
+      matches = {}
+      indexes = [loadSpellingIndex(f) for f in self.dictionaryFiles]
+      for w in missing:
+        best = None
+        for index in indexes:
+          match = index.nearest(w)
+          if((match is not None) and ((best is None) or (match < best))):
+            best = match
+        if(best is not None):
+          matches[w] = best
+
+      found = self.fetchWords(set(p for parts in splits.values() for p in parts) | set(m[1] for m in matches.values()))
+      for w in missing:
+        split = splits.get(w)
+        if((split is not None) and (not all(p in found for p in split))):
+          split = None
+        match = matches.get(w)
+        if((match is not None) and (match[1] not in found)):
+          match = None
+        #A close spelling beats chopping the word into pieces, unless
+        #it's further off than there are pieces, like "cartoondog".
+        if((match is not None) and ((split is None) or (match[0] < len(split)))):
+          self.missingWords[w] = (found[match[1]],"as "+match[1])
+        elif(split is not None):
+          self.missingWords[w] = (b"".join(found[p] for p in split),"as "+"+".join(split))
+        else:
+          self.missingWords[w] = (letterToSound.phonemes(w).translate(compileProfile(self.profile)),"guessed")
+
+  ###
+  # Get the visemes of dictionary words that might not have been
+  # loaded, when we only loaded the script's words.
+  #
+  def fetchWords(self,words):
+      found = {}
+      for w in words:
+        if w in self.phoneme_dictionary:
+          found[w] = self.phoneme_dictionary[w]
+      rest = [w for w in words if w not in found]
+      if((len(rest) > 0) and (self.fetchMainWords is not None)):
+        fetched = self.fetchMainWords(rest)
+        for w in rest:
+          if w in fetched:
+            found[w] = fetched[w]
+      return found
+
+  ###
+  # Summary of the words that weren't in the dictionary
+  #
+  def describeMissingWords(self):
+      words = []
+      for w in sorted(self.missingWords):
+        words.append(w+" ("+self.missingWords[w][1]+")")
+      return "Not in dictionary: "+", ".join(words)
+
   ###
   # Plot a specific word at a specific place
   #
   def plotWordToTimeline(self,w,frame,length):
-      phonemes = self.phoneme_dictionary[w.lower()] 
+      phonemes = self.lookupWord(w)
+      if(len(phonemes) == 0):
+        print("No phonemes for '"+w+"', skipping it")
+        return
       if(length > len(phonemes) * 5):
         #Obviously this word has a gap after it, fix the length lower
         length = len(phonemes) * 4;
    
       step = length/len(phonemes)
       current = frame-step/2
-      lastPhoneme = "non"
+      lastPhoneme = -1
       for p in phonemes:
         self.plotPhoneme(p,lastPhoneme,current,step)
         lastPhoneme = p
         current = current+step
       if(bpy.context.scene.quicktalk_bone_option == "2"):
         #Return to 'Rest' at the end of the word.
-        self.plotPhoneme("Rest",lastPhoneme,current,step);
+        self.plotPhoneme(VISEME_CODES["Rest"],lastPhoneme,current,step);
             
 
   ###
-  # Plot the phonemes to the timeline.
+  # The voices that actually say something in this script
+  #
+  def getVoices(self):
+      voices = set()
+      for d in self.streamDialogues():
+        voices.add(d.voice)
+      return voices
+
+  ###
+  # Which voices the active object speaks for: the ones the voice
+  # registry gives it, and any others not in the registry whose name
+  # its own name starts with, unless the registry has given it to
+  # another voice.
+  #
+  def activeTargets(self):
+      active = bpy.context.active_object
+      name = active.name.lower()
+      registry = getVoiceRegistry(bpy.context.scene)
+      registered = active.name in set(obj.name for obj in registry.values())
+      targets = {}
+      for voice in self.getVoices():
+        if voice in registry:
+          if registry[voice] == active:
+            targets[voice] = active
+        elif name[0:len(voice)] == voice:
+          if(not registered):
+            targets[voice] = active
+        else:
+          print("Non-Matching speaker: "+name[0:len(voice)]+":"+voice)
+      return targets
+
+  ###
+  # Start plotting to another object
+  #
+  def setTarget(self,obj):
+      if(obj is self.target):
+        return
+      self.target = obj
+      self.keyframes = self.writers[obj.name]
+      if(bpy.context.scene.quicktalk_bone_option == "2"):
+        #The MHX2 viseme buttons work on the active object
+        bpy.context.view_layer.objects.active = obj
+
+  ###
+  # Plot the phonemes to the timeline, each voice's words to its
+  # object in targets (voice -> object), or just the active
+  # object's voices if there aren't any targets.
   #
-  def plotTimelines(self):
+  def plotTimelines(self,targets=None):
       #Switch to a timeline
       default_frame = bpy.context.scene.frame_current
       default_area = bpy.context.area.type
+      default_active = bpy.context.active_object
       bpy.context.area.type = ('GRAPH_EDITOR')
 
-      #Find the word-start markers
-      wordStarts = []
-      for m in bpy.context.scene.timeline_markers:
-        if((m.name[-2:]=="!D") or (m.name[-2:]=="!L") or (m.name[-2:]=="!W")):
-          frame = m.frame
-          wordStarts.append(frame)
-      wordStarts.append(bpy.context.scene.frame_end)  #Fake one at the end of the scene
-      wordStarts = sorted(wordStarts)
-
-      #Add the actual plots
-      selectedobjectname = bpy.context.active_object.name.lower()
-      n=0;
-      for d in self.dialogues:
-          for l in d['lines']:
+      #Find the word-start markers, with a fake one at the end of the scene
+      wordStarts = getMarkerIndex(bpy.context.scene).starts(MARKER_KINDS,bpy.context.scene.frame_end)
+
+      #Somewhere to collect each object's keys
+      if(targets is None):
+        targets = self.activeTargets()
+      objects = dict((obj.name,obj) for obj in targets.values())
+      self.writers = {}
+      for (name,obj) in objects.items():
+        if(bpy.context.scene.quicktalk_bone_option == "1"):
+          self.writers[name] = QuickTalk_KeyframeWriter(obj,"location")
+        else:
+          self.writers[name] = QuickTalk_KeyframeWriter(obj,"rotation_euler")
+
+      #Plot all of a batch's words in one go if we can
+      usePlan = (numpy is not None) and (bpy.context.scene.quicktalk_bone_option != "2")
+      for batch in self.dialogueBatches():
+        if(self.dialogues is None):
+          self.loadWords(set(scriptWords[i] for d in batch for i in d.words))
+        words = dict((name,[]) for name in objects)
+        for d in batch:
+          target = targets.get(d.voice)
+          for ln in range(d.lineCount):
+            first = d.lineStarts[ln]
             if(bpy.context.scene.quicktalk_bone_option == "2"):
               #Start with a "Rest" if we're MXH2 import.
-              self.plotPhoneme("Rest","non",wordStarts[n]-3,3);
-            for w in l:
+              for obj in objects.values():
+                self.setTarget(obj)
+                self.plotPhoneme(VISEME_CODES["Rest"],-1,wordStarts[d.offset+first]-3,3);
+            if(target is None):
+              continue
+            self.setTarget(target)
+            for i in range(first,d.lineStarts[ln+1]):
+              n = d.offset + i
               startFrame = wordStarts[n]
-              n=n+1
-              endFrame = wordStarts[n]
-              if selectedobjectname[0:len(d['voice'])] == d['voice']:
+              endFrame = wordStarts[n+1]
+              w = scriptWords[d.words[i]]
+              if(not usePlan):
                 self.plotWordToTimeline(w,startFrame,endFrame-startFrame)
+              elif(len(self.lookupWord(w)) == 0):
+                print("No phonemes for '"+w+"', skipping it")
               else:
-                print("Non-Matching speaker: "+selectedobjectname[0:len(d['voice'])]+":"+d['voice'])
+                words[target.name].append((self.lookupWord(w),startFrame,endFrame))
+        for (name,obj) in objects.items():
+          if(len(words[name]) > 0):
+            writePlotPlan(compilePlotPlan(words[name]),self.writers[name],obj.pose.bones)
+        #Put the batch's keys on the curves now, so we only ever hold
+        #one batch's worth. Later batches' keys merge with them.
+        for writer in self.writers.values():
+          writer.write()
+      if(bpy.context.scene.quicktalk_reduce_keys):
+        if(numpy is None):
+          print("Can't simplify keys without NumPy")
+        else:
+          self.keyReduction = reduceKeyframes(objects.values(),bpy.context.scene.quicktalk_reduce_tolerance)
+      self.writers = {}
+      self.keyframes = None
+      self.target = None
 
+      if(default_active is not None):
+        bpy.context.view_layer.objects.active = default_active
       bpy.context.scene.frame_current = default_frame
       bpy.context.area.type = default_area
 
@@ -826,8 +2877,8 @@ class QuickTalk_Script:
   # 
   def dumpScript(self):
       for d in self.dialogues:
-        print("Dialogue - "+d['voice']+" - "+str(d['totalwords'])+" words:")
-        for l in d['lines']:
+        print("Dialogue - "+d.voice+" - "+str(d.totalwords)+" words:")
+        for l in d.lines:
           print("     ",end="")
           for w in l:
             print(w,end=" ")
@@ -847,7 +2898,7 @@ class QuickTalk_GuessDialogue(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}          # enable undo for the operator.
 
     def execute(self, context):
-        script = QuickTalk_Script(context.scene.quicktalk_script_file)
+        script = QuickTalk_Script(getScriptSource(context.scene),stream=True)
         script.addDialogueMarkers()
         
         return {'FINISHED'}
@@ -862,7 +2913,7 @@ class QuickTalk_GuessLines(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}          # enable undo for the operator.
 
     def execute(self, context):
-        script = QuickTalk_Script(context.scene.quicktalk_script_file)
+        script = QuickTalk_Script(getScriptSource(context.scene),stream=True)
         script.addLineMarkers()
         
         return {'FINISHED'}
@@ -878,7 +2929,7 @@ class QuickTalk_GuessWords(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}          # enable undo for the operator.
 
     def execute(self, context):
-        script = QuickTalk_Script(context.scene.quicktalk_script_file)
+        script = QuickTalk_Script(getScriptSource(context.scene),stream=True)
         script.addWordMarkers()
         
         return {'FINISHED'}
@@ -893,9 +2944,163 @@ class QuickTalk_QuicktalkPlot(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}          # enable undo for the operator.
 
     def execute(self, context):
-        script = QuickTalk_Script(context.scene.quicktalk_script_file)
+        script = QuickTalk_Script(getScriptSource(context.scene),stream=True)
         script.LoadDictionary()
         script.plotTimelines()
+        letterToSound.save()
+        if(len(script.missingWords) > 0):
+          self.report({'WARNING'}, script.describeMissingWords())
+        if(script.keyReduction is not None):
+          self.report({'INFO'}, "Simplified QuickTalk keys from %d to %d" % script.keyReduction)
         
         return {'FINISHED'}
 
+
+###
+# The Plot All Voices Function
+# Plots every voice to its own armature in one go, sharing one
+# read of the script and one load of the dictionary.
+#
+class QuickTalk_QuicktalkPlotAll(bpy.types.Operator):
+    """Plot every voice in the script to its armature"""
+    bl_idname = "object.quicktalk_plot_all"
+    bl_label = "Plot All Voices To Timeline"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        script = QuickTalk_Script(getScriptSource(context.scene),stream=True)
+        voices = script.getVoices()
+        targets = getVoiceTargets(context.scene,voices)
+        if(len(targets) == 0):
+          self.report({'ERROR'}, "No armatures named after any of the voices: "+", ".join(sorted(voices)))
+          return {'CANCELLED'}
+        script.LoadDictionary()
+        script.plotTimelines(targets)
+        letterToSound.save()
+        warnings = []
+        unmatched = sorted(v for v in voices if v not in targets)
+        if(len(unmatched) > 0):
+          warnings.append("No armature for: "+", ".join(unmatched))
+        if(len(script.missingWords) > 0):
+          warnings.append(script.describeMissingWords())
+        if(len(warnings) > 0):
+          self.report({'WARNING'}, ". ".join(warnings))
+        if(script.keyReduction is not None):
+          self.report({'INFO'}, "Simplified QuickTalk keys from %d to %d" % script.keyReduction)
+
+        return {'FINISHED'}
+
+
+###
+# The Fill In Voice Armatures Function
+# Adds the script's voices to the scene's voice registry, with the
+# armature whose name starts with the voice's if there is one and
+# it isn't already another voice's. Armatures already picked for a
+# voice are left alone.
+#
+class QuickTalk_FillVoices(bpy.types.Operator):
+    """Add the script's voices to the voice list and guess their armatures from their names"""
+    bl_idname = "object.quicktalk_fill_voices"
+    bl_label = "Fill In Voice Armatures"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        script = QuickTalk_Script(getScriptSource(context.scene),stream=True)
+        voices = script.getVoices()
+        entries = {}
+        for entry in context.scene.quicktalk_voices:
+          entries[entry.voice.strip().lower()] = entry
+        taken = set(obj.name for obj in getVoiceRegistry(context.scene).values())
+        found = findVoiceArmatures(context.scene,voices,taken)
+        for voice in sorted(voices):
+          if voice not in entries:
+            entries[voice] = context.scene.quicktalk_voices.add()
+            entries[voice].voice = voice
+          if((entries[voice].armature is None) and (voice in found)):
+            entries[voice].armature = found[voice]
+        unmatched = sorted(v for v in voices if entries[v].armature is None)
+        if(len(unmatched) > 0):
+          self.report({'WARNING'}, "No armature for: "+", ".join(unmatched))
+        return {'FINISHED'}
+
+
+###
+# Add an empty row to the scene's voice registry
+#
+class QuickTalk_AddVoice(bpy.types.Operator):
+    """Add a voice to the voice list"""
+    bl_idname = "object.quicktalk_add_voice"
+    bl_label = "Add Voice"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        context.scene.quicktalk_voices.add()
+        return {'FINISHED'}
+
+
+###
+# Remove a row from the scene's voice registry
+#
+class QuickTalk_RemoveVoice(bpy.types.Operator):
+    """Remove this voice from the voice list"""
+    bl_idname = "object.quicktalk_remove_voice"
+    bl_label = "Remove Voice"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    index: bpy.props.IntProperty (
+      name = "Index",
+      default = 0,
+      min = 0
+    )
+
+    def execute(self, context):
+        if(self.index >= len(context.scene.quicktalk_voices)):
+          return {'CANCELLED'}
+        context.scene.quicktalk_voices.remove(self.index)
+        return {'FINISHED'}
+
+
+###
+# Add an empty row to the scene's overlay dictionaries
+#
+class QuickTalk_AddOverlay(bpy.types.Operator):
+    """Add an overlay dictionary"""
+    bl_idname = "object.quicktalk_add_overlay"
+    bl_label = "Add Overlay Dictionary"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        context.scene.quicktalk_overlays.add()
+        return {'FINISHED'}
+
+
+###
+# Remove a row from the scene's overlay dictionaries
+#
+class QuickTalk_RemoveOverlay(bpy.types.Operator):
+    """Remove this overlay dictionary"""
+    bl_idname = "object.quicktalk_remove_overlay"
+    bl_label = "Remove Overlay Dictionary"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    index: bpy.props.IntProperty (
+      name = "Index",
+      default = 0,
+      min = 0
+    )
+
+    def execute(self, context):
+        if(self.index >= len(context.scene.quicktalk_overlays)):
+          return {'CANCELLED'}
+        context.scene.quicktalk_overlays.remove(self.index)
+        return {'FINISHED'}
+
+
+###
+# Run as a script, by parseRangesInSubprocesses, to parse part
+# of a dictionary and write the table to stdout.
+#
+if __name__ == "__main__":
+  if((len(sys.argv) == 5) and (sys.argv[1] == "--parse-range")):
+    packed = parseDictionaryRange(sys.argv[2],int(sys.argv[3]),int(sys.argv[4]))
+    sys.stdout.buffer.write(marshal.dumps(packed))
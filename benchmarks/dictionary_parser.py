@@ -0,0 +1,103 @@
+###
+# Micro-benchmark for the dictionary parser.
+# Times QuickTalk4's bytes-level parser against the line-by-line
+# parser LoadDictionary used to have, on the same dictionary, and
+# checks they give the same pronunciations. Runs with any Python 3,
+# no Blender needed:
+#
+#   python benchmarks/dictionary_parser.py [dictionary file] [runs]
+#
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import QuickTalk4
+
+
+###
+# The old parser, as it was in LoadDictionary: readlines(), a
+# re.sub() for every token of every entry and a list of viseme
+# name strings per word.
+#
+def oldParseDictionary(path, mappings):
+  phoneme_dictionary = {}
+  inFile = open(path, 'r')
+
+  for line in inFile.readlines():
+    if line[0] == '#':
+      continue # skip comments in the dictionary
+    # strip out leading/trailing whitespace
+    line.strip()
+    line = line.rstrip('\r\n')
+
+    # split into components
+    entry = line.split()
+    if len(entry) == 0:
+      continue
+    # Ditch dules that have (xx) after 'en
+    if entry[0].endswith(')'):
+      continue
+    # add this entry to the in-memory dictionary
+    for i in range(len(entry)):
+      name = entry[0]
+      name = re.sub('[\W_]+', '', name).lower()     #Remove non alphanumerics
+      if i == 0:
+        phoneme_dictionary[name] = []
+      else:
+        phoneme_dictionary[name].append(mappings[entry[i]])
+  inFile.close()
+  return phoneme_dictionary
+
+###
+# The new one, parsing to phonemes and mapping to the standard
+# profile's visemes, so it does the same job as the old one.
+#
+def newParseDictionary(path):
+  return QuickTalk4.parseDictionaryFile(path).translate(QuickTalk4.compileProfile("standard"))
+
+###
+# Best of a few runs
+#
+def timeIt(function, runs, *args):
+  best = None
+  for i in range(runs):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    if((best is None) or (elapsed < best)):
+      best = elapsed
+  return (best, result)
+
+
+def main():
+  path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "standard_dictionary")
+  runs = 5
+  if(len(sys.argv) > 1):
+    path = sys.argv[1]
+  if(len(sys.argv) > 2):
+    runs = int(sys.argv[2])
+
+  mapping = QuickTalk4.MAPPING_PROFILES["standard"]
+  mappings = dict((p, mapping[b]) for b in mapping for p in (b, b+"0", b+"1", b+"2"))
+
+  (oldTime, old) = timeIt(oldParseDictionary, runs, path, mappings)
+  (newTime, new) = timeIt(newParseDictionary, runs, path)
+
+  mismatches = 0
+  for word in old:
+    if([QuickTalk4.VISEMES[c] for c in new[word]] != old[word]):
+      mismatches = mismatches + 1
+  if(len(new) != len(old)):
+    mismatches = mismatches + abs(len(new) - len(old))
+
+  print("Dictionary: %s (%d words, best of %d runs)" % (path, len(old), runs))
+  print("Old parser: %8.1f ms" % (oldTime*1000))
+  print("New parser: %8.1f ms" % (newTime*1000))
+  print("Speedup:    %8.1fx" % (oldTime/newTime))
+  print("Mismatched words: %d" % mismatches)
+  return mismatches == 0
+
+if __name__ == "__main__":
+  sys.exit(0 if main() else 1)
@@ -0,0 +1,103 @@
+###
+# Micro-benchmark for compiling plot plans.
+# Times QuickTalk4's NumPy plot plan compiler against the sums
+# plotWordToTimeline and plotPhoneme do a word at a time, on words
+# from the dictionary spread over made-up markers, and checks they
+# make the same keys in the same order. Needs NumPy but no Blender:
+#
+#   python benchmarks/plot_plan.py [dictionary file] [words] [runs]
+#
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import QuickTalk4
+
+
+###
+# The keys plotting a word at a time makes for these words, as
+# (viseme code, frame, value)
+#
+def oldPlotKeys(words):
+  keys = []
+  for (phonemes, frame, end) in words:
+    length = end - frame
+    if(length > len(phonemes) * 5):
+      length = len(phonemes) * 4
+    step = length/len(phonemes)
+    current = frame-step/2
+    last = -1
+    for p in phonemes:
+      if(p != last):
+        keys.append((p, int(current), 0))
+      keys.append((p, int(current+step), 1.571))
+      keys.append((p, int(current+step+step), 0))
+      last = p
+      current = current+step
+  return keys
+
+###
+# The same from a compiled plan
+#
+def newPlotKeys(words):
+  return QuickTalk4.compilePlotPlan(words)
+
+###
+# Best of a few runs
+#
+def timeIt(function, runs, *args):
+  best = None
+  for i in range(runs):
+    start = time.perf_counter()
+    result = function(*args)
+    elapsed = time.perf_counter() - start
+    if((best is None) or (elapsed < best)):
+      best = elapsed
+  return (best, result)
+
+
+def main():
+  path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "standard_dictionary")
+  count = 100000
+  runs = 5
+  if(len(sys.argv) > 1):
+    path = sys.argv[1]
+  if(len(sys.argv) > 2):
+    count = int(sys.argv[2])
+  if(len(sys.argv) > 3):
+    runs = int(sys.argv[3])
+  if(QuickTalk4.numpy is None):
+    print("NumPy isn't installed")
+    return False
+
+  #Words one after the other, mostly a few frames each with the odd pause
+  dictionary = QuickTalk4.parseDictionaryFile(path).translate(QuickTalk4.compileProfile("standard"))
+  random.seed(1)
+  vocabulary = random.sample(list(dictionary.keys()), 5000)
+  words = []
+  frame = 1
+  for i in range(count):
+    phonemes = dictionary[random.choice(vocabulary)]
+    length = random.choice([1, 2, 3, 5, 8, 13, 40])
+    words.append((phonemes, frame, frame+length))
+    frame = frame + length
+
+  (oldTime, old) = timeIt(oldPlotKeys, runs, words)
+  (newTime, new) = timeIt(newPlotKeys, runs, words)
+
+  mismatches = abs(len(old) - len(new))
+  for (key, row) in zip(old, new.tolist()):
+    if((key[0], key[1]) != (row[0], row[1]) or abs(key[2] - row[2]) > 1e-6):
+      mismatches = mismatches + 1
+
+  print("Words: %d (%d keys, best of %d runs)" % (count, len(old), runs))
+  print("Word at a time: %8.1f ms" % (oldTime*1000))
+  print("Plot plan:      %8.1f ms" % (newTime*1000))
+  print("Speedup:        %8.1fx" % (oldTime/newTime))
+  print("Mismatched keys: %d" % mismatches)
+  return mismatches == 0
+
+if __name__ == "__main__":
+  sys.exit(0 if main() else 1)